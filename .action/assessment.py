@@ -25,15 +25,23 @@
 #
 """ Utilities to build, run, and evaluate student projects. """
 import csv
+import glob
 import os
-import pickle
-import re
+import shlex
 import sys
-import subprocess
-from ccsrcutilities import glob_all_src_files, strip_and_compare_files, format_check, lint_check, glob_cc_src_files
-from parse_header import dict_header, null_dict_header
+from ccsrcutilities import forget_compile_dbs, makefile_get_compilecmd, makefile_get_variable, glob_all_src_files, format_check_many, lint_check_many, lint_check_counts, glob_cc_src_files
+from fingerprint import starter_fingerprints
+from gradebook import default_gradebook, repo_commit
+from parse_header import null_dict_header
+from pch import pch_enabled, precompiled_header_flags
 from header_check import header_check
-from logger import setup_logger
+from logger import LazyJoin, log_context, set_log_context, setup_logger
+from resultcache import cache_key, file_digest, result_cache, tool_version
+from roster import student_roster
+from sandbox import children_cpu_time, peak_memory, reset_peak_memory, run_sandboxed
+from scratch import scratch_directory
+from sourcefile import forget_source_files, source_file
+from timing import reset_stage_durations, span, stage_durations
 
 def make_spotless(target_dir):
     """Given a directory that contains a GNU Makefile, clean with the `make
@@ -43,20 +51,138 @@ def make_spotless(target_dir):
     return status
 
 
-def make_build(target_dir, always_clean=True):
+def build_signature(target_dir):
+    """Return a digest of everything that invalidates the objects and
+    dependency files of a previous build: the Makefile, the compiler's
+    version, the compile command with its flags and whether a precompiled
+    header is used."""
+    compiler = makefile_get_variable(target_dir, 'CXX') or 'clang++'
+    return cache_key(
+        'build',
+        source_file(os.path.join(target_dir, 'Makefile')).digest,
+        tool_version(compiler),
+        makefile_get_compilecmd(target_dir, compiler),
+        pch_enabled(),
+    )
+
+
+def _build_environment(target_dir):
+    """Return the environment to build the part in target_dir with. The
+    Makefiles append to CXXFLAGS so the flags added reach every compile.
+    The directory is mapped to . in the debugging information, so the same
+    sources built in different scratch directories give the same binary,
+    and when precompiled headers are on, one is used for the part's
+    standard headers."""
+    flags = []
+    directories = {os.path.abspath(target_dir), os.path.realpath(target_dir)}
+    for directory in sorted(directories):
+        flags.append(shlex.quote(f'-ffile-prefix-map={directory}=.'))
+    if pch_enabled():
+        sources = (
+            (makefile_get_variable(target_dir, 'CXXFILES') or '').split()
+            + (makefile_get_variable(target_dir, 'HEADERS') or '').split()
+        )
+        compiler = makefile_get_variable(target_dir, 'CXX') or 'clang++'
+        pch_flags = precompiled_header_flags(
+            makefile_get_compilecmd(target_dir, compiler),
+            [os.path.join(target_dir, source) for source in sources],
+        )
+        if pch_flags:
+            flags.append(pch_flags)
+    flags.insert(0, os.environ.get('CXXFLAGS', ''))
+    return dict(os.environ, CXXFLAGS=' '.join(flags).strip())
+
+
+def artifact_key(target_dir):
+    """Return the build cache key for the part in target_dir: a digest of
+    every .cc, .h and .hpp file in the part, whether or not the Makefile
+    lists it, its CXXFILES, its Makefile, the compiler's version and the
+    compile command. Returns None if the part cannot be cached."""
+    cxxfiles = (makefile_get_variable(target_dir, 'CXXFILES') or '').split()
+    if not cxxfiles:
+        return None
+    sources = {
+        os.path.relpath(path, target_dir)
+        for path in glob_all_src_files(target_dir)
+        + glob.glob(os.path.join(target_dir, '**/*.hpp'), recursive=True)
+    }
+    sources.update(os.path.normpath(source) for source in cxxfiles)
+    try:
+        digests = [
+            (source, file_digest(os.path.join(target_dir, source)))
+            for source in sorted(sources)
+        ]
+    except FileNotFoundError:
+        return None
+    return cache_key('artifact', build_signature(target_dir), *digests)
+
+
+def _restore_artifact(cache, key, binary):
+    """Write the cached binary for key to binary. Returns True on a hit."""
+    data = cache.get(key)
+    if data is None:
+        return False
+    if os.path.exists(binary):
+        os.unlink(binary)
+    with open(binary, 'wb') as file_handle:
+        file_handle.write(data)
+    os.chmod(binary, 0o755)
+    return True
+
+
+def make_build(target_dir, always_clean=True, incremental=None):
     """Given a directory that contains a GNU Makefile, build with `make all`.
-    This function call will call `make spotless` via make_spotless()"""
+    This function call will call `make spotless` via make_spotless().
+    In incremental mode `make spotless` is skipped and make's dependency
+    files decide what to rebuild, unless the Makefile, compiler or flags
+    changed since the last build. Incremental mode defaults to on when the
+    environment variable MS_INCREMENTAL_BUILD is 1. When the part's sources,
+    Makefile and toolchain match an earlier build, the TARGET binary is
+    restored from the build cache and make is not run."""
+    logger = setup_logger()
+    cache = result_cache('artifacts')
+    target = makefile_get_variable(target_dir, 'TARGET')
+    key = artifact_key(target_dir) if cache and target else None
+    if key:
+        binary = os.path.join(target_dir, target)
+        if _restore_artifact(cache, key, binary):
+            logger.info('Restored %s from the build cache', target)
+            return True
+    if incremental is None:
+        incremental = os.environ.get('MS_INCREMENTAL_BUILD') == '1'
     status = True
+    stamp = os.path.join(target_dir, '.buildstamp')
+    signature = None
+    if incremental and os.path.exists(os.path.join(target_dir, 'Makefile')):
+        signature = build_signature(target_dir)
+        try:
+            with open(stamp) as file_handle:
+                always_clean = file_handle.read().strip() != signature
+        except FileNotFoundError:
+            always_clean = True
+        if always_clean:
+            logger.debug('Build settings changed; doing a clean build.')
+        else:
+            logger.debug('Build settings unchanged; building incrementally.')
     if always_clean:
         status = make_spotless(target_dir)
     if status:
-        status = make(target_dir, 'all')
+        status = make(target_dir, 'all', env=_build_environment(target_dir))
+    if signature:
+        if status:
+            with open(stamp, 'w') as file_handle:
+                file_handle.write(signature + '\n')
+        elif os.path.exists(stamp):
+            os.unlink(stamp)
+    if key and status and os.path.exists(binary):
+        with open(binary, 'rb') as file_handle:
+            cache.put(key, file_handle.read())
     return status
 
 
-def make(target_dir, make_target):
+def make(target_dir, make_target, env=None):
     """Given a directory, execute make_target given the GNU Makefile in the
-    directory."""
+    directory. env replaces the environment make runs with."""
     status = True
     logger = setup_logger()
     if not os.path.exists(os.path.join(target_dir, 'Makefile')):
@@ -65,46 +191,48 @@ def make(target_dir, make_target):
     else:
         cmd = 'make -C {} {}'.format(target_dir, make_target)
         logger.debug(cmd)
-        proc = subprocess.run(
-            [cmd],
-            capture_output=True,
-            shell=True,
-            timeout=15,
-            check=False,
-            text=True,
+        with span('make ' + make_target, category='make', directory=target_dir):
+            result = run_sandboxed(cmd, shell=True, timeout=15, env=env)
+        # if result.stdout:
+        #    logger.info('stdout: %s', str(result.stdout).rstrip("\n\r"))
+        if result.stderr:
+            logger.info('stderr: %s', str(result.stderr).rstrip("\n\r"))
+        if result.timed_out:
+            logger.error('make %s did not finish in 15 seconds.', make_target)
+        logger.debug(
+            'make %s used %.3fs CPU and %d KB peak memory',
+            make_target, result.cpu, result.max_rss,
         )
-        # if proc.stdout:
-        #    logger.info('stdout: %s', str(proc.stdout).rstrip("\n\r"))
-        if proc.stderr:
-            logger.info('stderr: %s', str(proc.stderr).rstrip("\n\r"))
-        if proc.returncode != 0:
+        if result.returncode != 0:
             status = False
     return status
 
 
-def build(file, target='asgt', compiletimeout=10):
+def build(file, target='asgt', compiletimeout=10, target_dir='.'):
     """Given a C++ source file, build with clang C++14 with -Wall
-    and -pedantic. Output is 'asgt'. Binary is left on the file system."""
+    and -pedantic. Output is target, 'asgt' by default, in target_dir.
+    Binary is left on the file system."""
     logger = setup_logger()
+    target = os.path.join(target_dir, target)
     # rm the file if exists
     if os.path.exists(target):
         os.unlink(target)
     status = True
-    cmd = 'clang++ -Wall -pedantic -std=c++14 -o {} {}'.format(target, file)
+    compile_cmd = 'clang++ -Wall -pedantic -std=c++14'
+    if pch_enabled():
+        compile_cmd = '{} {}'.format(
+            compile_cmd, precompiled_header_flags(compile_cmd, [file])
+        ).strip()
+    cmd = '{} -o {} {}'.format(compile_cmd, shlex.quote(target), shlex.quote(file))
     logger.debug(cmd)
-    proc = subprocess.run(
-        [cmd],
-        capture_output=True,
-        shell=True,
-        timeout=compiletimeout,
-        check=False,
-        text=True,
-    )
-    if proc.stdout:
-        logger.info('stdout: %s', str(proc.stdout).rstrip("\n\r"))
-    if proc.stderr:
-        logger.info('stderr: %s', str(proc.stderr).rstrip("\n\r"))
-    if proc.returncode != 0:
+    result = run_sandboxed(cmd, shell=True, timeout=compiletimeout)
+    if result.stdout:
+        logger.info('stdout: %s', str(result.stdout).rstrip("\n\r"))
+    if result.stderr:
+        logger.info('stderr: %s', str(result.stderr).rstrip("\n\r"))
+    if result.timed_out:
+        logger.error('The build did not finish in %d seconds.', compiletimeout)
+    if result.returncode != 0:
         status = False
     return status
 
@@ -118,16 +246,24 @@ def identify(header):
 
 def has_main_function(file):
     """Check if a given file has a C++ main function."""
-    status = False
-    main_regex = re.compile(
-        r'int\s*main\s*\(int\s*argc,\s*(const)?\s*char\s*(const)?\s*\*\s*argv\[\]\)'
-    )
-    with open(file, 'r') as file_handle:
-        src_code = file_handle.read()
-        matches = main_regex.search(src_code)
-        if matches:
-            status = True
-    return status
+    return source_file(file).has_main
+
+
+def _unchanged_from_starter(starter, file):
+    """Return True if file matches its starter file. Functions carried over
+    unchanged from the starter code are noted in the log."""
+    contents = source_file(file).contents
+    if starter.file_unchanged(file, contents):
+        return True
+    unchanged, total = starter.unchanged_functions(contents)
+    if unchanged:
+        setup_logger().info(
+            '%d of %d functions in %s are unchanged from the starter code.',
+            unchanged,
+            total,
+            file,
+        )
+    return False
 
 
 def solution_check_simple(run=None, files=None, do_format_check=True, do_lint_check=True, tidy_options=None, skip_compile_cmd=False):
@@ -153,17 +289,16 @@ def solution_check_simple(run=None, files=None, do_format_check=True, do_lint_ch
         sys.exit(1)
 
     # Header checks
-    files_missing_header = [file for file in files if not header_check(file)]
-    files_with_header = [file for file in files if header_check(file)]
+    has_header = {file: header_check(file) for file in files}
+    files_missing_header = [file for file in files if not has_header[file]]
+    files_with_header = [file for file in files if has_header[file]]
     header = None
     if len(files_with_header) == 0:
         logger.error('❌ No header provided in any file in %s. Exiting.', target_directory)
         logger.error('All files: %s', ' '.join(files))
         sys.exit(1)
     else:
-        with open(files_with_header[0]) as file_handle:
-            contents = file_handle.read()
-        header = dict_header(contents)
+        header = source_file(files_with_header[0]).header
     
     logger.info('Start %s', identify(header))
     logger.info('All files: %s', ' '.join(files))
@@ -175,9 +310,9 @@ def solution_check_simple(run=None, files=None, do_format_check=True, do_lint_ch
     # Check if files have changed
     if base_directory:
         count = 0
+        starter = starter_fingerprints(base_directory)
         for file in files:
-            diff = strip_and_compare_files(file, os.path.join(base_directory, file))
-            if len(diff) == 0:
+            if _unchanged_from_starter(starter, file):
                 count += 1
                 logger.error('No changes made to the file %s.', file)
         if count == len(files):
@@ -188,24 +323,24 @@ def solution_check_simple(run=None, files=None, do_format_check=True, do_lint_ch
 
     # Format
     if do_format_check:
-        for file in files:
-            diff = format_check(file)
+        diffs = format_check_many(files)
+        for file, diff in zip(files, diffs):
             if len(diff) != 0:
                 logger.warning('❌ Formatting needs improvement in %s.', file)
                 logger.info(
                     'Please make sure your code conforms to the Google C++ style.'
                 )
-                logger.debug('\n'.join(diff))
+                logger.debug('%s', LazyJoin(diff))
             else:
                 logger.info('✅ Formatting passed on %s', file)
 
     # Lint
     if do_lint_check:
-        for file in files:
-            lint_warnings = lint_check(file, tidy_options, skip_compile_cmd)
+        all_lint_warnings = lint_check_many(files, tidy_options, skip_compile_cmd)
+        for file, lint_warnings in zip(files, all_lint_warnings):
             if len(lint_warnings) != 0:
                 logger.warning('❌ Linter found improvements in %s.', file)
-                logger.debug('\n'.join(lint_warnings))
+                logger.debug('%s', LazyJoin(lint_warnings))
             else:
                 logger.info('✅ Linting passed in %s', file)
 
@@ -232,19 +367,20 @@ def solution_check_simple(run=None, files=None, do_format_check=True, do_lint_ch
                 logger.warning('Extra main function found in %s', file)
     if main_src_file:
         logger.info('Checking build for %s', main_src_file)
-        if build(main_src_file):
-            logger.info('✅ Build passed')
-            # Run
-            if not run:
-                logger.info('No run function specified...skipping.')
-            elif run and run('./' + sys.argv[2]):
-                logger.info('✅ Run passed')
+        with scratch_directory(target_directory) as build_directory:
+            if build(os.path.abspath(main_src_file), target_dir=build_directory):
+                logger.info('✅ Build passed')
+                # Run
+                if not run:
+                    logger.info('No run function specified...skipping.')
+                elif run and run(os.path.join(build_directory, sys.argv[2])):
+                    logger.info('✅ Run passed')
+                else:
+                    logger.error('❌ Run failed')
+                    status = 1
             else:
-                logger.error('❌ Run failed')
+                logger.error('❌ Build failed')
                 status = 1
-        else:
-            logger.error('❌ Build failed')
-            status = 1
     else:
         logger.error('❌ No main function found in files: %s', ' '.join(cc_files))
         status = 1
@@ -276,21 +412,19 @@ def solution_check_make(target_directory, program_name='asgt', base_directory=No
         sys.exit(1)
 
     # Header checks
-    files_missing_header = [file for file in files if not header_check(file)]
-    files_with_header = [file for file in files if header_check(file)]
+    has_header = {file: header_check(file) for file in files}
+    files_missing_header = [file for file in files if not has_header[file]]
+    files_with_header = [file for file in files if has_header[file]]
     header = None
     if len(files_with_header) == 0:
         logger.error('❌ No header provided in any file in %s. Exiting.', target_directory)
         logger.error('All files: %s', ' '.join(files))
         sys.exit(1)
     else:
-        with open(files_with_header[0]) as file_handle:
-            contents = file_handle.read()
-        header = dict_header(contents)
+        header = source_file(files_with_header[0]).header
 
     logger.info('Start %s', identify(header))
     logger.info('All files: %s', ' '.join(files))
-    files_missing_header = [file for file in files if not header_check(file)]
     if len(files_missing_header) != 0:
         logger.warning(
             'Files missing headers: %s', ' '.join(files_missing_header)
@@ -299,9 +433,9 @@ def solution_check_make(target_directory, program_name='asgt', base_directory=No
     # Check if files have changed
     if base_directory:
         count = 0
+        starter = starter_fingerprints(base_directory)
         for file in files:
-            diff = strip_and_compare_files(file, os.path.join(base_directory, file))
-            if len(diff) == 0:
+            if _unchanged_from_starter(starter, file):
                 count += 1
                 logger.error('No changes made in file %s.', file)
         if count == len(files):
@@ -312,213 +446,328 @@ def solution_check_make(target_directory, program_name='asgt', base_directory=No
 
     # Format
     if do_format_check:
-        for file in files:
-            diff = format_check(file)
+        diffs = format_check_many(files)
+        for file, diff in zip(files, diffs):
             if len(diff) != 0:
                 logger.warning('❌ Formatting needs improvement in %s.', file)
                 logger.info(
                     'Please make sure your code conforms to the Google C++ style.'
                 )
-                logger.debug('\n'.join(diff))
+                logger.debug('%s', LazyJoin(diff))
             else:
                 logger.info('✅ Formatting passed on %s', file)
 
     # Lint
     if do_lint_check:
-        for file in files:
-            lint_warnings = lint_check(file, tidy_options, skip_compile_cmd)
+        all_lint_warnings = lint_check_many(files, tidy_options, skip_compile_cmd)
+        for file, lint_warnings in zip(files, all_lint_warnings):
             if len(lint_warnings) != 0:
                 logger.warning('❌ Linter found improvements in %s.', file)
-                logger.debug('\n'.join(lint_warnings))
+                logger.debug('%s', LazyJoin(lint_warnings))
             else:
                 logger.info('✅ Linting passed in %s', file)
 
     status = 0
     # Clean, Build, & Run
-    if make_build(target_directory):
-        logger.info('✅ Build passed')
-        # Run
-        run_stats = run(os.path.join(target_directory, program_name))
-        total_stats = sum(run_stats)
-        if total_stats:
-            logger.info('✅ Test run passed')
+    with scratch_directory(target_directory) as build_directory:
+        if make_build(build_directory):
+            logger.info('✅ Build passed')
+            # Run
+            run_stats = run(os.path.join(build_directory, program_name))
+            total_stats = sum(run_stats)
+            if total_stats:
+                logger.info('✅ Test run passed')
+            else:
+                logger.error('❌ Test run failed')
+                status = 1
         else:
-            logger.error('❌ Test run failed')
+            logger.error('❌ Build failed')
             status = 1
-    else:
-        logger.error('❌ Build failed')
-        status = 1
     logger.info('End %s', identify(header))
     sys.exit(status)
 
-def csv_solution_check_make(csv_key, target_directory, program_name='asgt', base_directory=None, run=None, files=None, do_format_check=True, do_lint_check=True, tidy_options=None, skip_compile_cmd=False):
+gradelog_fields = ['Repo Name', 'Part', 'Author', 'Partner1', 'Partner2', 'Partner3', 'PartnerN', 'Formatting', 'Linting', 'Lint Checks', 'Build', 'Tests', 'Scaling', 'Notes', 'Header Time', 'Format Time', 'Lint Time', 'Build Time', 'Test Time', 'Profile Time', 'Build CPU Time', 'Build Peak Memory', 'Test CPU Time']
+
+# The gradelog column holding the seconds spent in each timed stage.
+stage_time_fields = {
+    'header': 'Header Time',
+    'format': 'Format Time',
+    'lint': 'Lint Time',
+    'build': 'Build Time',
+    'test': 'Test Time',
+    'profile': 'Profile Time',
+}
+
+# A scaling exponent above this marks an implementation as pathological.
+scaling_limit = float(os.environ.get('MS_SCALING_LIMIT', '1.5'))
+
+
+def write_gradelog(csv_path, rows):
+    """Write the given gradelog rows to csv_path as a CSV file."""
+    with open(csv_path, 'w') as csv_output_handle:
+        outcsv = csv.DictWriter(csv_output_handle, gradelog_fields)
+        outcsv.writeheader()
+        for row in rows:
+            outcsv.writerow(row)
+
+
+def csv_solution_check_make(csv_key, target_directory, program_name='asgt', base_directory=None, run=None, files=None, do_format_check=True, do_lint_check=True, tidy_options=None, skip_compile_cmd=False, profile=None):
     """Main function for checking student's solution. Provide a pointer to a
-    run function."""
-    logger = setup_logger()
-    students_file = os.environ.get("MS_GITUSER_PICKLE")
-    students_dict = None
-    if not students_file:
-        logger.debug('Missing environment variable MS_GITUSER_PICKLE. Cannot convert GitHub logins to sortable names.')
-    else:
-        logger.info("Loading student information")
-        with open(students_file, "rb") as fh:
-            # The students file contains only one dict
-            students_dict = pickle.load(fh)
+    run function. The result is recorded in the gradebook named by the
+    environment variable MS_GRADEBOOK or, if there is none, written to a
+    gradelog CSV file in the directory above target_directory."""
     abs_path_target_dir = os.path.abspath(target_directory)
     repo_root = os.path.dirname(abs_path_target_dir)
     cwd_name = os.path.basename(abs_path_target_dir)
     csv_filename = f'.{csv_key}_{cwd_name}_gradelog.csv'
     csv_path = os.path.join(repo_root, csv_filename)
-    csv_fields = ['Repo Name', 'Part', 'Author', 'Partner1', 'Partner2', 'Partner3', 'PartnerN', 'Formatting', 'Linting', 'Build', 'Tests', 'Notes']
+    status, row = csv_solution_check(
+        csv_key,
+        target_directory,
+        program_name=program_name,
+        base_directory=base_directory,
+        run=run,
+        files=files,
+        do_format_check=do_format_check,
+        do_lint_check=do_lint_check,
+        tidy_options=tidy_options,
+        skip_compile_cmd=skip_compile_cmd,
+        profile=profile,
+    )
+    gradebook = default_gradebook()
+    if gradebook:
+        gradebook.record(row, status, repo_commit(abs_path_target_dir))
+    else:
+        write_gradelog(csv_path, [row])
+    sys.exit(status)
+
+
+def csv_solution_check(csv_key, target_directory, program_name='asgt', base_directory=None, run=None, files=None, do_format_check=True, do_lint_check=True, tidy_options=None, skip_compile_cmd=False, profile=None):
+    """Check a student's solution and return the exit status and the
+    gradelog row as a tuple. Provide a pointer to a run function and
+    optionally a profile function which returns the program's scaling
+    exponent and measurements as profiling.profile_scaling() does. When
+    timing is enabled, the seconds spent in each stage are added to the
+    row."""
+    reset_stage_durations()
+    part = os.path.basename(os.path.abspath(target_directory))
+    with log_context(repo=csv_key, part=part), span(
+        'grade', category='job', repo=csv_key, part=target_directory
+    ):
+        try:
+            status, row = _csv_solution_check(
+                csv_key,
+                target_directory,
+                program_name=program_name,
+                base_directory=base_directory,
+                run=run,
+                files=files,
+                do_format_check=do_format_check,
+                do_lint_check=do_lint_check,
+                tidy_options=tidy_options,
+                skip_compile_cmd=skip_compile_cmd,
+                profile=profile,
+            )
+        finally:
+            # Remove this job's temporary compile DBs.
+            forget_compile_dbs()
+    for stage, duration in stage_durations().items():
+        if stage in stage_time_fields:
+            row[stage_time_fields[stage]] = f'{duration:.3f}'
+    return (status, row)
+
+
+def _csv_solution_check(csv_key, target_directory, program_name, base_directory, run, files, do_format_check, do_lint_check, tidy_options, skip_compile_cmd, profile):
+    logger = setup_logger()
+    # Reread the submission's files from disk for this run.
+    forget_source_files()
+    roster = student_roster()
+    if not roster:
+        logger.debug('Missing environment variable MS_ROSTER or MS_GITUSER_PICKLE. Cannot convert GitHub logins to sortable names.')
+    abs_path_target_dir = os.path.abspath(target_directory)
+    cwd_name = os.path.basename(abs_path_target_dir)
     status = 0
-    with open(csv_path, 'w') as csv_output_handle:
-        outcsv = csv.DictWriter(csv_output_handle, csv_fields)
-        outcsv.writeheader()
-        row = {}
-        row['Repo Name'] = csv_key
-        row['Part'] = cwd_name
-        # Init to empty string so you're always adding notes.
-        row['Notes'] =''
-        if not files:
-            # This could be a target in the Makefile
-            files = glob_all_src_files(target_directory)
-        else:
-            files = [os.path.join(target_directory, file) for file in files]
+    row = {}
+    row['Repo Name'] = csv_key
+    row['Part'] = cwd_name
+    # Init to empty string so you're always adding notes.
+    row['Notes'] =''
+    if not files:
+        # This could be a target in the Makefile
+        files = glob_all_src_files(target_directory)
+    else:
+        files = [os.path.join(target_directory, file) for file in files]
 
-        if len(files) == 0:
-            logger.error("❌ No files in %s.", target_directory)
-            row['Formatting'] = 0
-            row['Linting'] = 0
-            row['Build'] = 0
-            row['Tests'] = 0
-            row['Notes'] = f"❌ No files in {target_directory}."
-            status = 1
-        else:
-            # Header checks
-            files_missing_header = [file for file in files if not header_check(file)]
-            files_with_header = [file for file in files if header_check(file)]
-            header = null_dict_header()
-            if len(files_with_header) == 0:
-                logger.error('❌ No header provided in any file in %s. Exiting.', target_directory)
-                logger.error('All files: %s', ' '.join(files))
-                row['Formatting'] = 0
-                row['Linting'] = 0
-                row['Build'] = 0
-                row['Tests'] = 0
-                all_files = ' '.join(files)
-                row['Notes'] = f'❌ No header provided in any file in {target_directory}. All files: {all_files}.'
-                status = 1
-            else:
-                with open(files_with_header[0]) as file_handle:
-                    contents = file_handle.read()
-                header = dict_header(contents)
-
-
-            logger.info('Start %s', identify(header))
-            logger.info('All files: %s', ' '.join(files))
-            files_missing_header = [file for file in files if not header_check(file)]
-            names = header['name'].split()
-            sortable_name = '{}, {}'.format(names[-1], ' '.join(names[:len(names)-1]))
-            row['Author'] = sortable_name
-            partners = header['partners'].replace(',', ' ').replace('@', '').lower().split()
-            sortable_names = []
-            
-            # Map GitHub login to student name
-            if students_dict:
-                # sortable partner names
-                for github_login in partners:
-                    print(github_login)
-                    student_name = students_dict[github_login] if github_login in students_dict else None
-                    if not student_name:
-                        logger.warning(f"No such user in db '{github_login}'. Skipping.")
-                        row['Notes'] = row['Notes'] + f'❌ Partner: no such user in db {github_login}.'
-                        name = github_login
-                    else:
-                        name = '"{}, {}"'.format(student_name[0], student_name[1])
-                    sortable_names.append(name)
+    if len(files) == 0:
+        logger.error("❌ No files in %s.", target_directory)
+        row['Formatting'] = 0
+        row['Linting'] = 0
+        row['Build'] = 0
+        row['Tests'] = 0
+        row['Notes'] = f"❌ No files in {target_directory}."
+        return (1, row)
+
+    # Header checks
+    set_log_context(stage='header')
+    with span('header'):
+        has_header = {file: header_check(file) for file in files}
+    files_missing_header = [file for file in files if not has_header[file]]
+    files_with_header = [file for file in files if has_header[file]]
+    header = null_dict_header()
+    if len(files_with_header) == 0:
+        logger.error('❌ No header provided in any file in %s. Exiting.', target_directory)
+        logger.error('All files: %s', ' '.join(files))
+        row['Formatting'] = 0
+        row['Linting'] = 0
+        row['Build'] = 0
+        row['Tests'] = 0
+        all_files = ' '.join(files)
+        row['Notes'] = f'❌ No header provided in any file in {target_directory}. All files: {all_files}.'
+        status = 1
+    else:
+        header = source_file(files_with_header[0]).header
+
+
+    logger.info('Start %s', identify(header))
+    logger.info('All files: %s', ' '.join(files))
+    names = header['name'].split()
+    sortable_name = '{}, {}'.format(names[-1], ' '.join(names[:len(names)-1]))
+    row['Author'] = sortable_name
+    partners = header['partners'].replace(',', ' ').replace('@', '').lower().split()
+    sortable_names = []
+    
+    # Map GitHub login to student name
+    if roster:
+        # sortable partner names
+        for github_login in partners:
+            student_name = roster.lookup(github_login)
+            if not student_name:
+                logger.warning(f"No such user in db '{github_login}'. Skipping.")
+                row['Notes'] = row['Notes'] + f'❌ Partner: no such user in db {github_login}.'
+                name = github_login
             else:
-                # Can't map the logins to names, just use them as is.
-                sortable_names = partners
-            for num, name in enumerate(sortable_names, start=1):
-                key = f'Partner{num}'
-                if num > 3:
-                    break
-                row[key] = name
-            if len(sortable_names) > 3:
-                row['PartnerN'] = ';'.join(sortable_names[3:])
-
-            if len(files_missing_header) != 0:
-                files_missing_header_str = ' '.join(files_missing_header)
-                logger.warning(
-                    'Files missing headers: %s', files_missing_header_str
+                name = '"{}, {}"'.format(student_name[0], student_name[1])
+            sortable_names.append(name)
+    else:
+        # Can't map the logins to names, just use them as is.
+        sortable_names = partners
+    for num, name in enumerate(sortable_names, start=1):
+        key = f'Partner{num}'
+        if num > 3:
+            break
+        row[key] = name
+    if len(sortable_names) > 3:
+        row['PartnerN'] = ';'.join(sortable_names[3:])
+
+    if len(files_missing_header) != 0:
+        files_missing_header_str = ' '.join(files_missing_header)
+        logger.warning(
+            'Files missing headers: %s', files_missing_header_str
+        )
+        row['Notes'] = row['Notes'] + f'❌Files missing headers: {files_missing_header_str}\n'
+        status = 1
+    # Check if files have changed
+    if base_directory:
+        count = 0
+        starter = starter_fingerprints(base_directory)
+        for file in files:
+            if _unchanged_from_starter(starter, file):
+                count += 1
+                logger.error('No changes made in file %s.', file)
+        if count == len(files):
+            logger.error('No changes made ANY file. Stopping.')
+            row['Notes'] = row['Notes'] + '❌ No changes made to any file.\n'
+            return (1, row)
+    else:
+        logger.debug('Skipping base file comparison.')
+
+    # Format
+    if do_format_check:
+        count = 0
+        set_log_context(stage='format')
+        with span('format'):
+            diffs = format_check_many(files)
+        for file, diff in zip(files, diffs):
+            if len(diff) != 0:
+                logger.warning('❌ Formatting needs improvement in %s.', file)
+                logger.info(
+                    'Please make sure your code conforms to the Google C++ style.'
                 )
-                row['Notes'] = row['Notes'] + f'❌Files missing headers: {files_missing_header_str}\n'
+                logger.debug('%s', LazyJoin(diff))
+                row['Notes'] = row['Notes'] + f'❌ Formatting needs improvement in {file}.\n'
                 status = 1
-            # Check if files have changed
-            if base_directory:
-                count = 0
-                for file in files:
-                    diff = strip_and_compare_files(file, os.path.join(base_directory, file))
-                    if len(diff) == 0:
-                        count += 1
-                        logger.error('No changes made in file %s.', file)
-                if count == len(files):
-                    logger.error('No changes made ANY file. Stopping.')
-                    sys.exit(1)
             else:
-                logger.debug('Skipping base file comparison.')
-
-            # Format
-            if do_format_check:
-                count = 0
-                for file in files:
-                    diff = format_check(file)
-                    if len(diff) != 0:
-                        logger.warning('❌ Formatting needs improvement in %s.', file)
-                        logger.info(
-                            'Please make sure your code conforms to the Google C++ style.'
-                        )
-                        logger.debug('\n'.join(diff))
-                        row['Notes'] = row['Notes'] + f'❌ Formatting needs improvement in {file}.\n'
-                        status = 1
-                    else:
-                        logger.info('✅ Formatting passed on %s', file)
-                        count += 1
-                row['Formatting'] = f'{count}/{len(files)}'
-
-            # Lint
-            if do_lint_check:
-                count = 0
-                for file in files:
-                    lint_warnings = lint_check(file, tidy_options, skip_compile_cmd)
-                    if len(lint_warnings) != 0:
-                        logger.warning('❌ Linter found improvements in %s.', file)
-                        logger.debug('\n'.join(lint_warnings))
-                        row['Notes'] = row['Notes'] + f'❌ Linter found improvements in {file}.\n'
-                        status = 1
-                    else:
-                        logger.info('✅ Linting passed in %s', file)
-                        count += 1
-                row['Linting'] = f'{count}/{len(files)}'
-            # Clean, Build, & Run
-            if make_build(target_directory):
-                logger.info('✅ Build passed')
-                row['Build'] = 1
-                # Run
-                run_stats = run(os.path.join(target_directory, program_name))
-                if all(run_stats):
-                    logger.info('✅ All test runs passed')
-                else:
-                    logger.error('❌ One or more runs failed')
-                    row['Notes'] = row['Notes'] + f'❌ One or more test runs failed\n'
-                    status = 1
-                row['Tests'] = f'{sum(run_stats)}/{len(run_stats)}'
+                logger.info('✅ Formatting passed on %s', file)
+                count += 1
+        row['Formatting'] = f'{count}/{len(files)}'
+
+    # Lint
+    if do_lint_check:
+        count = 0
+        set_log_context(stage='lint')
+        with span('lint'):
+            all_lint_warnings = lint_check_many(files, tidy_options, skip_compile_cmd)
+        for file, lint_warnings in zip(files, all_lint_warnings):
+            if len(lint_warnings) != 0:
+                logger.warning('❌ Linter found improvements in %s.', file)
+                logger.debug('%s', LazyJoin(lint_warnings))
+                row['Notes'] = row['Notes'] + f'❌ Linter found improvements in {file}.\n'
+                status = 1
             else:
-                logger.error('❌ Build failed')
-                row['Build'] = 0
-                row['Notes'] = row['Notes'] + f'❌ Build failed\n'
-                row['Tests'] = '0/0'
+                logger.info('✅ Linting passed in %s', file)
+                count += 1
+        row['Linting'] = f'{count}/{len(files)}'
+        check_counts = lint_check_counts(
+            warning for lint_warnings in all_lint_warnings for warning in lint_warnings
+        )
+        row['Lint Checks'] = ';'.join(
+            f'{check}={num}' for check, num in sorted(check_counts.items())
+        )
+    # Clean, Build, & Run in a private copy of the part's directory.
+    with scratch_directory(target_directory) as build_directory:
+        set_log_context(stage='build')
+        cpu_before = children_cpu_time()
+        reset_peak_memory()
+        with span('build'):
+            build_passed = make_build(build_directory)
+        row['Build CPU Time'] = f'{children_cpu_time() - cpu_before:.3f}'
+        row['Build Peak Memory'] = peak_memory()
+        if build_passed:
+            logger.info('✅ Build passed')
+            row['Build'] = 1
+            # Run
+            set_log_context(stage='test')
+            cpu_before = children_cpu_time()
+            with span('test'):
+                run_stats = run(os.path.join(build_directory, program_name))
+            row['Test CPU Time'] = f'{children_cpu_time() - cpu_before:.3f}'
+            if all(run_stats):
+                logger.info('✅ All test runs passed')
+            else:
+                logger.error('❌ One or more runs failed')
+                row['Notes'] = row['Notes'] + f'❌ One or more test runs failed\n'
                 status = 1
-            logger.info('End %s', identify(header))
-        outcsv.writerow(row)
-    sys.exit(status)
+            row['Tests'] = f'{sum(run_stats)}/{len(run_stats)}'
+            if profile and all(run_stats):
+                set_log_context(stage='profile')
+                with span('profile'):
+                    exponent, _ = profile(os.path.join(build_directory, program_name))
+                if exponent is None:
+                    logger.info('✅ Runs were too fast to measure how they scale')
+                else:
+                    row['Scaling'] = f'{exponent:.2f}'
+                    if exponent > scaling_limit:
+                        logger.warning(
+                            '❌ Run time grows as the input size to the power %.2f',
+                            exponent,
+                        )
+                    else:
+                        logger.info('✅ Run time grows as the input size to the power %.2f', exponent)
+        else:
+            logger.error('❌ Build failed')
+            row['Build'] = 0
+            row['Notes'] = row['Notes'] + f'❌ Build failed\n'
+            row['Tests'] = '0/0'
+            status = 1
+    logger.info('End %s', identify(header))
+    return (status, row)
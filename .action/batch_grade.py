@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Grade many student repositories at once. Each repository and part
+    pair is graded in a separate worker process and the results are
+    merged into a single gradelog. """
+
+# ex.
+# .action/batch_grade.py -j 32 -o section-01.csv repos/*
+
+import argparse
+import concurrent.futures
+import os
+import os.path
+import sys
+from assessment import csv_solution_check, write_gradelog
+from ccsrcutilities import glob_all_src_files, makefile_get_variable
+from gradebook import open_gradebook, repo_commit
+from logger import flush_logger, setup_logger
+from roster import student_roster
+from similarity import load_similarity_index
+from solution_check import part_profiles, part_runs, tidy_opts
+import timing
+
+
+def _init_worker(workers):
+    """Share the CPUs between the worker processes. Each worker lints files
+    and runs test cases on at most its share at once, unless
+    MS_STAGE_WORKERS or MS_TEST_WORKERS are set."""
+    share = str(max(1, (os.cpu_count() or 1) // workers))
+    os.environ.setdefault('MS_STAGE_WORKERS', share)
+    os.environ.setdefault('MS_TEST_WORKERS', share)
+
+
+def _grade_job(repo, part, gradebook=None):
+    """Grade one part of one repository and return the gradelog row. This
+    function runs in a worker process; it changes into the part's directory
+    because the tests read and write files relative to the current working
+    directory. If gradebook is given, the grade is recorded in the
+    gradebook database at that path."""
+    logger = setup_logger()
+    csv_key = os.path.basename(os.path.abspath(repo))
+    target_directory = os.path.join(repo, part)
+    row = {'Repo Name': csv_key, 'Part': part, 'Notes': ''}
+    if part not in part_runs:
+        logger.error('No tests defined for %s.', part)
+        row['Notes'] = f'❌ No tests defined for {part}.'
+        return row
+    if not os.path.isdir(target_directory):
+        logger.error('❌ No such directory %s.', target_directory)
+        row['Notes'] = f'❌ No such directory {target_directory}.'
+        return row
+    program_name = makefile_get_variable(target_directory, 'TARGET') or 'asgt'
+    repo_path = os.path.abspath(repo)
+    cwd = os.getcwd()
+    os.chdir(target_directory)
+    try:
+        status, row = csv_solution_check(
+            csv_key,
+            '.',
+            program_name=program_name,
+            run=part_runs[part],
+            profile=part_profiles.get(part),
+            tidy_options=tidy_opts,
+        )
+        # The row names the part after the working directory.
+        row['Part'] = part
+        if gradebook:
+            open_gradebook(gradebook).record(row, status, repo_commit(repo_path))
+    except Exception as exception:
+        logger.exception('Grading %s %s failed.', csv_key, part)
+        row['Notes'] = f'❌ Grader error: {exception}'
+    finally:
+        os.chdir(cwd)
+        # Worker processes exit without running atexit handlers.
+        if timing.trace_path:
+            timing.write_trace(timing.worker_trace_path())
+        flush_logger()
+    return row
+
+
+def grade_many(repos, parts, workers=None, gradelog=None, similarity=None, gradebook=None, starters=()):
+    """Grade every part in parts for every repository in repos using a pool
+    of workers processes. Returns the gradelog rows sorted by repository and
+    part. If gradelog is given, the rows are also written to that CSV file.
+    If similarity is given, the graded source files are added to the
+    similarity index saved at that path and similar pairs are logged; code
+    in the starters, such as the template repository, is not counted. If
+    gradebook is given, each worker records its grades in the gradebook
+    database at that path."""
+    logger = setup_logger()
+    jobs = [(repo, part) for repo in repos for part in parts]
+    workers = workers or os.cpu_count() or 1
+    logger.info('Grading %d jobs with %d workers', len(jobs), workers)
+    # Index the roster once so the workers only open it.
+    student_roster()
+    rows = []
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(workers,)
+    ) as executor:
+        futures = {
+            executor.submit(_grade_job, repo, part, gradebook): (repo, part)
+            for repo, part in jobs
+        }
+        for future in concurrent.futures.as_completed(futures):
+            repo, part = futures[future]
+            try:
+                rows.append(future.result())
+            except Exception as exception:
+                # The worker process died; still report the job.
+                logger.error('Worker grading %s %s failed: %s', repo, part, exception)
+                rows.append({
+                    'Repo Name': os.path.basename(os.path.abspath(repo)),
+                    'Part': part,
+                    'Notes': f'❌ Grader error: {exception}',
+                })
+    rows.sort(key=lambda row: (row['Repo Name'], row['Part']))
+    if gradelog:
+        write_gradelog(gradelog, rows)
+        logger.info('Wrote %d rows to %s', len(rows), gradelog)
+    if similarity:
+        index = load_similarity_index(similarity)
+        if starters:
+            index.set_starter(
+                file for starter in starters for file in glob_all_src_files(starter)
+            )
+        for repo in repos:
+            index.add_repo(repo, parts)
+        index.save(similarity)
+        for score, group, first, second in index.candidate_pairs():
+            logger.warning(
+                'Similar submissions (%.2f): %s in %s and %s',
+                score, group, first, second,
+            )
+    return rows
+
+
+def main():
+    """ Main function; grade all the repositories given on the command
+    line. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('repos', nargs='+', help='student repositories to grade')
+    parser.add_argument(
+        '-p', '--part', action='append', dest='parts',
+        help='part to grade; may be repeated (default: all parts)',
+    )
+    parser.add_argument(
+        '-j', '--workers', type=int, default=None,
+        help='number of worker processes (default: number of CPUs)',
+    )
+    parser.add_argument(
+        '-o', '--output', default='gradelog.csv',
+        help='merged gradelog CSV file (default: gradelog.csv)',
+    )
+    parser.add_argument(
+        '-s', '--similarity', default=None,
+        help='similarity index to add the graded files to',
+    )
+    parser.add_argument(
+        '--starter', action='append', default=[],
+        help='starter code directory whose code the similarity index ignores; may be repeated',
+    )
+    parser.add_argument(
+        '-g', '--gradebook', default=os.environ.get('MS_GRADEBOOK'),
+        help='gradebook database to record the grades in (default: $MS_GRADEBOOK)',
+    )
+    args = parser.parse_args()
+    parts = args.parts if args.parts else sorted(part_runs)
+    rows = grade_many(
+        args.repos,
+        parts,
+        workers=args.workers,
+        gradelog=args.output,
+        similarity=args.similarity,
+        gradebook=args.gradebook,
+        starters=args.starter,
+    )
+    status = 0
+    if any(row['Notes'] for row in rows):
+        status = 1
+    sys.exit(status)
+
+if __name__ == '__main__':
+    main()
@@ -37,10 +37,17 @@ def main():
         logger.warning('Only %s arguments provided.', len(sys.argv))
         logger.warning('Provide a target directory to `make`.')
         sys.exit(1)
+    # --incremental skips `make spotless` when the build settings are
+    # unchanged.
+    incremental = None
+    target_dirs = sys.argv[1:]
+    if '--incremental' in target_dirs:
+        incremental = True
+        target_dirs.remove('--incremental')
     status = 0
-    for target_dir in sys.argv[1:]:
+    for target_dir in target_dirs:
         logger.info("Checking build for %s", target_dir)
-        if make_build(target_dir):
+        if make_build(target_dir, incremental=incremental):
             logger.info('😀 Build passed 🥳')
         else:
             logger.error("🤯😳😤😫🤬")
@@ -26,49 +26,90 @@
 """ Utilities used to manipulate C++ source code files from student
     assignments. """
 
+import atexit
+import bisect
+import collections
+import concurrent.futures
+import contextvars
 import glob
 import subprocess
 import difflib
 import os.path
 import logging
-from mkcompiledb import create_clang_compile_commands_db
-from logger import setup_logger
+import re
+import shlex
+import shutil
+import tempfile
+import threading
+import xml.etree.ElementTree
+from mkcompiledb import create_clang_compile_commands_db, platform_compile_cmd
+from logger import LazyJoin, setup_logger
+from pch import pch_enabled, pch_usable_for_lint, precompiled_header_flags
+from resultcache import cache_key, result_cache, tool_version
+from sourcefile import source_file
+from timing import span
+
+# One alternative per kind of C++ token which matters when stripping
+# comments. Order matters: raw and prefixed literals come before
+# identifiers, and numbers come before character literals so that digit
+# separators such as 1'000 are not read as a character literal.
+_cpp_token_regex = re.compile(
+    r"""
+    (?P<block_comment>/\*.*?(?:\*/|\Z))
+    | (?P<line_comment>//(?:\\\n|[^\n])*)
+    | (?P<raw_string>(?:u8|[uUL])?R"(?P<delimiter>[^ ()\\\t\v\f\n]{0,16})\(.*?\)(?P=delimiter)")
+    | (?P<string>(?:u8|[uUL])?"(?:\\.|[^"\\\n])*")
+    | (?P<number>\.?\d(?:'?[\w.]|[eEpP][+-])*)
+    | (?P<char>(?:u8|[uUL])?'(?:\\.|[^'\\\n])*')
+    | (?P<identifier>[A-Za-z_]\w*)
+    | (?P<splice>\\\n)
+    | (?P<newline>\n)
+    | (?P<space>[ \t\f\v\r]+)
+    | (?P<other>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+def cpp_tokens(text):
+    """Split C++ source into (kind, text) tuples in a single pass. The kinds
+    are the group names of _cpp_token_regex."""
+    for match in _cpp_token_regex.finditer(text):
+        yield (match.lastgroup, match.group())
+
+
+def normalize_cpp_source(text):
+    """Remove comments and blank lines from C++ source and collapse runs of
+    whitespace to a single space. String, character and raw string literals
+    are kept as is."""
+    lines = []
+    line = []
+    pending_space = False
+    for kind, token in cpp_tokens(text):
+        if kind == 'newline' or (kind == 'block_comment' and '\n' in token):
+            lines.append(''.join(line))
+            # A multi-line comment ends the line like the newlines it
+            # replaces.
+            lines.extend([''] * (token.count('\n') - 1))
+            line = []
+            pending_space = False
+        elif kind in ('space', 'splice', 'line_comment', 'block_comment'):
+            pending_space = bool(line)
+        else:
+            if pending_space:
+                line.append(' ')
+                pending_space = False
+            line.append(token)
+    lines.append(''.join(line))
+    return '\n'.join(line for line in lines if line)
+
 
 def remove_cpp_comments(file):
-    """Remove CPP comments from a file using the CPP preprocessor"""
-    # Inspired by
-    # https://stackoverflow.com/questions/13061785/remove-multi-line-comments
-    # and
-    # https://stackoverflow.com/questions/35700193/how-to-find-a-search-term-in-source-code/35708616#35708616
+    """Remove CPP comments from a file and normalize its whitespace. See
+    normalize_cpp_source()."""
     no_comments = None
-    cmd = 'clang++ -E -P -'
     try:
-        with open(file) as file_handle:
-            # replace 'a', '__' and '#' to avoid preprocessor handling
-            filtered_contents = (
-                file_handle.read()
-                .replace('a', 'aA')
-                .replace('__', 'aB')
-                .replace('#', 'aC')
-            )
-        proc = subprocess.run(
-            [cmd],
-            capture_output=True,
-            shell=True,
-            timeout=10,
-            check=False,
-            text=True,
-            input=filtered_contents,
-        )
-        if proc.returncode == 0:
-            no_comments = (
-                proc.stdout.replace('aC', '#')
-                .replace('aB', '__')
-                .replace('aA', 'a')
-            )
-        else:
-            logging.error('Errors encountered removing comments.')
-            logging.error('stderr {}'.format(str(proc.stderr).rstrip("\n\r")))
+        no_comments = normalize_cpp_source(source_file(file).contents)
     except FileNotFoundError as exception:
         logging.error('Cannot remove comments. No such file. %s', file)
     return no_comments
@@ -87,10 +128,25 @@ def makefile_has_compilecmd(target_makefile):
     return has_compilecmd
 
 
+# Compile commands and compile command DBs are discovered once per
+# directory and reused for the rest of the run.
+_compilecmd_memo = {}
+_compile_db_memo = {}
+_memo_lock = threading.Lock()
+
+
 def makefile_get_compilecmd(target_dir, compiler='clang++'):
     """Given a Makefile with the compilecmd target, return the string
     which represents the compile command. For use with making the
-    compile database for linting."""
+    compile database for linting. The answer is memoized per directory."""
+    key = (os.path.realpath(target_dir), compiler)
+    with _memo_lock:
+        if key not in _compilecmd_memo:
+            _compilecmd_memo[key] = _makefile_get_compilecmd(target_dir, compiler)
+        return _compilecmd_memo[key]
+
+
+def _makefile_get_compilecmd(target_dir, compiler):
     logger = setup_logger()
     compilecmd = None
     makefiles = glob.glob(
@@ -121,6 +177,68 @@ def makefile_get_compilecmd(target_dir, compiler='clang++'):
         logger.debug('Could not identify compile command; using default.')
     return compilecmd
 
+def _remove_compile_dbs():
+    for db_dir in _compile_db_memo.values():
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+
+atexit.register(_remove_compile_dbs)
+
+
+def forget_compile_dbs():
+    """Remove the compile command DBs made so far and forget the compile
+    commands, so the next grading run discovers them again. Worker
+    processes do not run atexit handlers, so call this after each job."""
+    with _memo_lock:
+        _remove_compile_dbs()
+        _compile_db_memo.clear()
+        _compilecmd_memo.clear()
+
+
+def compile_commands_dir(file, compilecmd=None):
+    """Return a private temporary directory holding a compile_commands.json
+    for file, suitable for clang-tidy's -p option. When the Makefile gave a
+    compile command, one DB covering every .cc file in file's directory is
+    created and shared by all the files in that directory. The directories
+    are removed by forget_compile_dbs() or when the process exits."""
+    logger = setup_logger()
+    if compilecmd:
+        key = (os.path.dirname(os.path.realpath(file)), compilecmd)
+    else:
+        key = (os.path.realpath(file), None)
+    with _memo_lock:
+        if key not in _compile_db_memo:
+            db_dir = tempfile.mkdtemp(prefix='compiledb-')
+            if compilecmd:
+                logger.debug('Using compile command %s', compilecmd)
+                create_clang_compile_commands_db(
+                    files=glob_cc_src_files(key[0]), compile_cmd=compilecmd, out_dir=db_dir
+                )
+            else:
+                logger.debug('Creating compile commands.')
+                create_clang_compile_commands_db(files=[key[0]], out_dir=db_dir)
+            logger.debug('Created clang compile command db in %s.', db_dir)
+            _compile_db_memo[key] = db_dir
+        return _compile_db_memo[key]
+
+
+def makefile_get_variable(target_dir, name):
+    """Given a directory with a Makefile, return the value of the first
+    simple assignment to the variable name such as TARGET or CXXFILES.
+    Returns None if the variable is not assigned."""
+    value = None
+    var_regex = re.compile(r'^{}\s*[:+?]?=\s*(.*?)\s*$'.format(re.escape(name)))
+    try:
+        with open(os.path.join(target_dir, 'Makefile')) as file_handle:
+            for line in file_handle:
+                matches = var_regex.match(line)
+                if matches:
+                    value = matches.group(1)
+                    break
+    except FileNotFoundError as exception:
+        logging.error('Cannot open Makefile in "%s" for reading.', target_dir)
+    return value
+
 def strip_and_compare_files(base_file, submission_file):
     """ Compare two source files with a contextual diff, return \
     result as a list of lines. """
@@ -144,61 +262,166 @@ def strip_and_compare_files(base_file, submission_file):
     return list(diff)
 
 
+def _parse_format_replacements(xml_output):
+    """Parse the output of `clang-format -output-replacements-xml`. When
+    given several files, clang-format prints one XML document per file.
+    Returns a list with one list of (offset, length, text) tuples per
+    document."""
+    documents = [
+        document
+        for document in re.split(r'(?=<\?xml )', xml_output)
+        if document.strip()
+    ]
+    all_replacements = []
+    for document in documents:
+        root = xml.etree.ElementTree.fromstring(document)
+        all_replacements.append([
+            (int(element.get('offset')), int(element.get('length')), element.text or '')
+            for element in root.iter('replacement')
+        ])
+    return all_replacements
+
+
+def _renumber_hunk_header(line, offset):
+    """Shift the line numbers in a context diff hunk header by offset."""
+    return re.sub(r'\d+', lambda match: str(int(match.group(0)) + offset), line)
+
+
+def replacement_diff(original, replacements, context=3):
+    """Given the original contents of a file as bytes and clang-format's
+    replacements, return a contextual diff as a list of lines. Only the
+    regions touched by a replacement are diffed. The line numbers match
+    those of a diff of the whole file."""
+    line_starts = [0]
+    position = original.find(b'\n')
+    while position != -1:
+        line_starts.append(position + 1)
+        position = original.find(b'\n', position + 1)
+    last_line = len(line_starts) - 1
+    # Group the replacements into regions of lines, merging regions whose
+    # context overlaps.
+    regions = []
+    for offset, length, text in sorted(replacements):
+        text = text.encode('utf-8')
+        if original[offset:offset + length] == text:
+            continue
+        first = max(0, bisect.bisect_right(line_starts, offset) - 1 - context)
+        last = min(
+            last_line, bisect.bisect_right(line_starts, offset + length) - 1 + context
+        )
+        if regions and first <= regions[-1][1] + 1:
+            regions[-1][1] = max(regions[-1][1], last)
+            regions[-1][2].append((offset, length, text))
+        else:
+            regions.append([first, last, [(offset, length, text)]])
+    diff = []
+    line_delta = 0
+    for first, last, region_replacements in regions:
+        start = line_starts[first]
+        if last < last_line:
+            end = line_starts[last + 1] - 1
+        else:
+            end = len(original)
+        fixed = original[start:end]
+        for offset, length, text in reversed(region_replacements):
+            offset = offset - start
+            fixed = fixed[:offset] + text + fixed[offset + length:]
+        original_lines = original[start:end].decode('utf-8', 'replace').split('\n')
+        fixed_lines = fixed.decode('utf-8', 'replace').split('\n')
+        hunk = list(difflib.context_diff(
+            original_lines,
+            fixed_lines,
+            'Student Submission (Yours)',
+            'Correct Format',
+            n=context,
+        ))
+        if not hunk:
+            continue
+        if not diff:
+            diff.extend(hunk[:2])
+        diff.append(hunk[2])
+        original_side = True
+        for line in hunk[3:]:
+            stripped_line = line.rstrip('\n')
+            if stripped_line.startswith('*** ') and stripped_line.endswith(' ****') and original_side:
+                line = _renumber_hunk_header(line, first)
+            elif stripped_line.startswith('--- ') and stripped_line.endswith(' ----'):
+                line = _renumber_hunk_header(line, first + line_delta)
+                original_side = False
+            elif stripped_line == '***************':
+                original_side = True
+            diff.append(line)
+        line_delta += len(fixed_lines) - len(original_lines)
+    return diff
+
+
+def format_check_many(files):
+    """ Use clang-format to check the format of many files against the \
+    Google C++ style with a single clang-format process. Returns a list \
+    with a contextual diff for each file, in the order given. Results are \
+    cached on each file's contents, the clang-format version and the \
+    options. """
+    logger = setup_logger()
+    cmd_options = ['-style=Google', '-output-replacements-xml']
+    cache = result_cache('format')
+    keys = {}
+    diffs = {}
+    contents = {}
+    for file in files:
+        contents[file] = source_file(file).data
+        if cache:
+            keys[file] = cache_key(
+                'format',
+                source_file(file).digest,
+                tool_version('clang-format'),
+                ' '.join(cmd_options),
+            )
+            cached_diff = cache.get_json(keys[file])
+            if cached_diff is not None:
+                diffs[file] = cached_diff
+    unchecked = [file for file in files if file not in diffs]
+    if unchecked:
+        cmd = ['clang-format'] + cmd_options + unchecked
+        logger.debug('clang format: %s', LazyJoin(cmd, ' '))
+        all_replacements = None
+        try:
+            with span('clang-format', category='tool', files=len(unchecked)):
+                proc = subprocess.run(
+                    cmd,
+                    capture_output=True,
+                    timeout=10 * len(unchecked),
+                    check=False,
+                    text=True,
+                )
+            if proc.returncode == 0:
+                all_replacements = _parse_format_replacements(proc.stdout)
+            else:
+                logger.error('clang-format failed: %s', str(proc.stderr).rstrip("\n\r"))
+        except (OSError, subprocess.TimeoutExpired, xml.etree.ElementTree.ParseError) as exception:
+            logger.error('clang-format failed: %s', exception)
+        if all_replacements is not None and len(all_replacements) == len(unchecked):
+            for file, replacements in zip(unchecked, all_replacements):
+                diffs[file] = replacement_diff(contents[file], replacements)
+                if cache:
+                    cache.put_json(keys[file], diffs[file])
+        elif len(unchecked) > 1:
+            # Find out which file clang-format could not handle.
+            for file, diff in zip(unchecked, format_check_many(unchecked[:1])
+                                  + format_check_many(unchecked[1:])):
+                diffs[file] = diff
+        else:
+            diffs[unchecked[0]] = ['Could not check formatting with clang-format.']
+    return [diffs[file] for file in files]
+
+
 def format_check(file):
     """ Use clang-format to check file's format against the \
-    Google C++ style. """
-    # logger = setup_logger()
-    # clang-format
-    cmd = 'clang-format'
-    cmd_options = '-style=Google --Werror'
-    cmd = cmd + ' ' + cmd_options + ' ' + file
-    # logger.debug('clang format: %s', cmd)
-    proc = subprocess.run(
-        [cmd],
-        capture_output=True,
-        shell=True,
-        timeout=10,
-        check=False,
-        text=True,
-    )
-    correct_format = str(proc.stdout).split('\n')
-    with open(file) as file_handle:
-        original_format = file_handle.read().split('\n')
-    diff = difflib.context_diff(
-        original_format,
-        correct_format,
-        'Student Submission (Yours)',
-        'Correct Format',
-        n=3,
-    )
-    # print('\n'.join(list(diff)))
-    return list(diff)
+    Google C++ style. Returns a contextual diff of the regions \
+    which need to be reformatted. """
+    return format_check_many([file])[0]
 
 
-def lint_check(file, tidy_options=None, skip_compile_cmd=False):
-    """ Use clang-tidy to lint the file. Options for clang-tidy \
-    defined in the function. """
-    logger = setup_logger()
-    # clang-tidy
-    if not skip_compile_cmd:
-        logger.debug('Checking for makefile in %s', os.path.dirname(os.path.realpath(file)))
-        compilecmd = makefile_get_compilecmd(
-            os.path.dirname(os.path.realpath(file))
-        )
-        logger.debug('Makefile reported compile commmand as %s', compilecmd)
-    if not skip_compile_cmd and compilecmd:
-        logger.debug('Using compile command %s', compilecmd)
-        create_clang_compile_commands_db(
-            remove_existing_db=True, compile_cmd=compilecmd
-        )
-        logger.debug('Created clang compile command db.')
-    elif not skip_compile_cmd and not compilecmd:
-        logger.debug('Creating compile commands.')
-        create_clang_compile_commands_db(files=[file], remove_existing_db=True)
-    cmd = 'clang-tidy'
-    if not tidy_options:
-        logger.debug('Using default tidy options.')
-        cmd_options = r'-checks="-*,google-*, modernize-*, \
+_default_tidy_options = r'-checks="-*,google-*, modernize-*, \
         readability-*,cppcoreguidelines-*,\
         -google-build-using-namespace,\
         -google-readability-todo,\
@@ -207,24 +430,201 @@ def lint_check(file, tidy_options=None, skip_compile_cmd=False):
         -readability-magic-numbers,\
         -cppcoreguidelines-pro-type-union-access,\
         -cppcoreguidelines-pro-bounds-constant-array-index"'
-        # cmd_options = '-checks="*"'
+# cmd_options = '-checks="*"'
+
+_diagnostic_regex = re.compile(
+    r'^(?P<file>.+?):(?P<line>\d+):(?P<column>\d+): '
+    r'(?P<severity>warning|error|note|remark): '
+    r'(?P<message>.*?)(?: \[(?P<check>[^\]]+)\])?$'
+)
+
+
+class LintDiagnostic(collections.namedtuple(
+        'LintDiagnostic',
+        ['file', 'line', 'column', 'severity', 'message', 'check', 'context'])):
+    """A single clang-tidy warning or error. The context holds the source
+    excerpt and any notes which clang-tidy printed after the diagnostic."""
+    __slots__ = ()
+
+    def __str__(self):
+        location = '{}:{}:{}: {}: {} [{}]'.format(
+            self.file, self.line, self.column, self.severity, self.message, self.check
+        )
+        return '\n'.join([location] + list(self.context))
+
+
+def parse_lint_output(output):
+    """Parse clang-tidy's output into a list of LintDiagnostic records.
+    Notes and source excerpts are attached to the preceding diagnostic."""
+    diagnostics = []
+    for line in output.split('\n'):
+        matches = _diagnostic_regex.match(line)
+        if matches and matches.group('severity') in ('warning', 'error'):
+            diagnostics.append(LintDiagnostic(
+                matches.group('file'),
+                int(matches.group('line')),
+                int(matches.group('column')),
+                matches.group('severity'),
+                matches.group('message'),
+                matches.group('check') or 'clang-diagnostic',
+                [],
+            ))
+        elif diagnostics and line != '':
+            diagnostics[-1].context.append(line)
+    return [diagnostic._replace(context=tuple(diagnostic.context)) for diagnostic in diagnostics]
+
+
+def lint_check_counts(diagnostics):
+    """Count the diagnostics by check name."""
+    return collections.Counter(diagnostic.check for diagnostic in diagnostics)
+
+
+def run_file_stage(check, files, max_workers=None):
+    """Run check on every file concurrently using a bounded pool of threads.
+    Each check spends its time waiting on a clang subprocess so threads are
+    sufficient. The results are returned in the same order as files so the
+    caller's logging and counts are deterministic. The pool size defaults
+    to the environment variable MS_STAGE_WORKERS or the number of CPUs."""
+    if not max_workers:
+        max_workers = int(os.environ.get('MS_STAGE_WORKERS', os.cpu_count() or 1))
+    max_workers = min(max_workers, len(files))
+    if max_workers <= 1:
+        return [check(file) for file in files]
+    # Worker threads start with an empty context; carry over the caller's
+    # log context, one copy per call since a context is not reentrant.
+    context = contextvars.copy_context()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda file: context.copy().run(check, file), files))
+
+
+def _lint_cache_key(file, cmd_options, skip_compile_cmd, compilecmd):
+    # The diagnostics name the file by its absolute path, so identical
+    # files in different checkouts must not share an entry.
+    path = os.path.realpath(file)
+    # Local headers are part of the translation unit.
+    headers = sorted(glob_h_src_files(os.path.dirname(path)))
+    return cache_key(
+        'lint-diagnostics',
+        path,
+        source_file(file).digest,
+        *[source_file(header).digest for header in headers],
+        tool_version('clang-tidy'),
+        cmd_options,
+        skip_compile_cmd,
+        compilecmd,
+    )
+
+
+def _run_clang_tidy(files, cmd_options, skip_compile_cmd, compilecmd):
+    """Run one clang-tidy process over all the given files, which share a
+    directory, and return the parsed diagnostics. The header filter limits
+    the diagnostics to files in that directory."""
+    logger = setup_logger()
+    target_dir = os.path.dirname(os.path.realpath(files[0]))
+    header_filter = '^' + re.escape(target_dir + os.sep)
+    cmd = 'clang-tidy {} -header-filter={} {}'.format(
+        cmd_options,
+        shlex.quote(header_filter),
+        ' '.join(shlex.quote(file) for file in files),
+    )
+    if not skip_compile_cmd:
+        cmd = cmd + ' -p ' + compile_commands_dir(files[0], compilecmd)
     else:
-        cmd_options = tidy_options
-    cmd = cmd + ' ' + cmd_options + ' ' + file
-    if skip_compile_cmd:
         cmd = cmd + ' -- -std=c++17'
     logger.debug('Tidy command %s', cmd)
-    proc = subprocess.run(
-        [cmd],
-        capture_output=True,
-        shell=True,
-        timeout=60,
-        check=False,
-        text=True,
+    with span('clang-tidy', category='tool', files=' '.join(files)):
+        proc = subprocess.run(
+            [cmd],
+            capture_output=True,
+            shell=True,
+            timeout=60 * len(files),
+            check=False,
+            text=True,
+        )
+    return parse_lint_output(str(proc.stdout))
+
+
+def lint_check_many(files, tidy_options=None, skip_compile_cmd=False):
+    """ Use clang-tidy to lint many files. Options for clang-tidy are \
+    defined in the function. The files in each directory are linted \
+    together, like run-clang-tidy, spread over at most MS_STAGE_WORKERS \
+    clang-tidy processes; diagnostics in headers are reported once. \
+    Returns a list of LintDiagnostic records for each file, in the order \
+    given. Results are cached on the contents of the file and the headers \
+    beside it, the clang-tidy version, the options and the compile \
+    command. """
+    logger = setup_logger()
+    if not tidy_options:
+        logger.debug('Using default tidy options.')
+        cmd_options = _default_tidy_options
+    else:
+        cmd_options = tidy_options
+    cache = result_cache('lint')
+    keys = {}
+    results = {}
+    directories = collections.defaultdict(list)
+    for file in files:
+        directories[os.path.dirname(os.path.realpath(file))].append(file)
+    jobs = []
+    for target_dir, dir_files in directories.items():
+        compilecmd = None
+        if not skip_compile_cmd:
+            logger.debug('Checking for makefile in %s', target_dir)
+            compilecmd = makefile_get_compilecmd(target_dir)
+            logger.debug('Makefile reported compile commmand as %s', compilecmd)
+            if compilecmd and pch_enabled() and pch_usable_for_lint(shlex.split(compilecmd)[0]):
+                pch_flags = precompiled_header_flags(
+                    platform_compile_cmd(compilecmd), glob_cc_src_files(target_dir)
+                )
+                compilecmd = f'{compilecmd} {pch_flags}'.strip()
+        unchecked = []
+        for file in dir_files:
+            if cache:
+                keys[file] = _lint_cache_key(file, cmd_options, skip_compile_cmd, compilecmd)
+                cached_diagnostics = cache.get_json(keys[file])
+                if cached_diagnostics is not None:
+                    logger.debug('Using cached lint results for %s', file)
+                    results[file] = [
+                        LintDiagnostic(*diagnostic[:-1], tuple(diagnostic[-1]))
+                        for diagnostic in cached_diagnostics
+                    ]
+                    continue
+            unchecked.append(file)
+        if unchecked:
+            jobs.append((unchecked, compilecmd))
+    # Split each directory's files into chunks so the chunks can be linted
+    # in parallel.
+    max_workers = int(os.environ.get('MS_STAGE_WORKERS', os.cpu_count() or 1))
+    chunks = []
+    for unchecked, compilecmd in jobs:
+        num_chunks = max(1, min(len(unchecked), max_workers // len(jobs)))
+        for index in range(num_chunks):
+            chunks.append((unchecked[index::num_chunks], compilecmd))
+    all_diagnostics = run_file_stage(
+        lambda chunk: _run_clang_tidy(chunk[0], cmd_options, skip_compile_cmd, chunk[1]),
+        chunks,
+        max_workers,
     )
-    linter_warnings = str(proc.stdout).split('\n')
-    linter_warnings = [line for line in linter_warnings if line != '']
-    return linter_warnings
+    unchecked = [file for chunk_files, _ in chunks for file in chunk_files]
+    paths = {os.path.realpath(file): file for file in unchecked}
+    for file in unchecked:
+        results[file] = []
+    for diagnostics in all_diagnostics:
+        for diagnostic in diagnostics:
+            file = paths.get(os.path.realpath(diagnostic.file))
+            # Headers included by several files are reported repeatedly.
+            if file and diagnostic not in results[file]:
+                results[file].append(diagnostic)
+    if cache and tool_version('clang-tidy'):
+        for file in unchecked:
+            cache.put_json(keys[file], results[file])
+    return [results[file] for file in files]
+
+
+def lint_check(file, tidy_options=None, skip_compile_cmd=False):
+    """ Use clang-tidy to lint the file. Returns a list of \
+    LintDiagnostic records. """
+    return lint_check_many([file], tidy_options, skip_compile_cmd)[0]
 
 def glob_cc_src_files(target_dir='.'):
     """Recurse through the target_dir and find all the .cc files."""
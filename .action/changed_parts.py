@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Grade only the parts of a repository which changed since the last
+    graded commit. The paths changed between that commit and the working
+    tree are mapped to their part-N directories and `make -C part-N test`
+    runs for each changed part; the results of the other parts are carried
+    forward.
+    A change to the grader or the top-level Makefile, or a missing or
+    unknown last graded commit, regrades every part. """
+
+import argparse
+import glob
+import json
+import os
+import os.path
+import re
+import subprocess
+import sys
+import tempfile
+from gradebook import default_gradebook
+from logger import setup_logger
+from resultcache import cache_key, cache_root
+
+_part_name = r'part-\d+'
+_part_regex = re.compile(rf'^({_part_name})/')
+# Changes to these paths can change every part's grade.
+_grader_paths = ('.action/', 'Makefile')
+# Changes to these files in a part do not change its grade.
+_ignored_suffixes = ('.md',)
+
+
+def _git(repo, *args):
+    """Run git in repo and return its stripped output, or None if it
+    fails."""
+    try:
+        proc = subprocess.run(
+            ['git', '-C', repo] + list(args),
+            capture_output=True,
+            timeout=60,
+            check=False,
+            text=True,
+        )
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return None
+    return proc.stdout.strip() if proc.returncode == 0 else None
+
+
+def all_parts(repo):
+    """Return the part-N directories in repo."""
+    names = (
+        os.path.basename(os.path.dirname(path))
+        for path in glob.glob(os.path.join(repo, 'part-*', ''))
+    )
+    return sorted(name for name in names if re.fullmatch(_part_name, name))
+
+
+def changed_parts(repo, base, head=None):
+    """Return the set of parts with changes between the commits base and
+    head, or None if every part must be graded. When head is None base is
+    compared with the working tree, uncommitted and untracked files
+    included. A moved file changes both the part it left and the part it
+    joined."""
+    if not base or _git(repo, 'cat-file', '-e', base + '^{commit}') is None:
+        return None
+    revisions = [base] if head is None else [base, head]
+    changed = _git(repo, 'diff', '--name-only', '--no-renames', *revisions, '--')
+    if changed is None:
+        return None
+    paths = changed.splitlines()
+    if head is None:
+        untracked = _git(repo, 'ls-files', '--others', '--exclude-standard')
+        if untracked is None:
+            return None
+        paths += untracked.splitlines()
+    parts = set()
+    for path in paths:
+        matches = _part_regex.match(path)
+        if matches:
+            if not path.endswith(_ignored_suffixes):
+                parts.add(matches.group(1))
+        elif path.startswith(_grader_paths):
+            return None
+    return parts
+
+
+def _state_path(repo):
+    """Return the file which holds the last graded commit of repo."""
+    origin = _git(repo, 'config', '--get', 'remote.origin.url')
+    identity = origin or os.path.realpath(repo)
+    return os.path.join(cache_root(), 'changed-parts', cache_key(identity) + '.json')
+
+
+def load_state(repo):
+    """Return the last graded commit of repo and the exit status of each of
+    its parts, or (None, {}) if it has not been graded."""
+    try:
+        with open(_state_path(repo)) as file_handle:
+            state = json.load(file_handle)
+        return (state['commit'], state['parts'])
+    except (OSError, ValueError, KeyError):
+        return (None, {})
+
+
+def save_state(repo, commit, statuses):
+    """Record commit as the last graded commit of repo."""
+    path = _state_path(repo)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(handle, 'w') as file_handle:
+        json.dump({'commit': commit, 'parts': statuses}, file_handle)
+    os.replace(tmp_path, path)
+
+
+def grade_changed(repo='.', base=None, regrade_all=False):
+    """Grade the parts of repo which changed since base, which defaults to
+    the last graded commit, and return the exit status of every part. The
+    result of an unchanged part is the one recorded for base: the saved
+    state's for the last graded commit, or otherwise the gradebook's. A
+    part without a result recorded for base is graded."""
+    logger = setup_logger()
+    repo = _git(repo, 'rev-parse', '--show-toplevel') or repo
+    head = _git(repo, 'rev-parse', 'HEAD')
+    last_commit, previous = load_state(repo)
+    gradebook = default_gradebook()
+    repo_name = os.path.basename(os.path.abspath(repo))
+    parts = all_parts(repo)
+    if base is None:
+        base = last_commit
+    else:
+        # Compare commit hashes rather than names such as HEAD~1.
+        base = _git(repo, 'rev-parse', '--verify', '--quiet', base + '^{commit}') or base
+        if base != last_commit:
+            previous = {}
+            if gradebook:
+                for part in parts:
+                    status = gradebook.status(repo_name, part, base)
+                    if status is not None:
+                        previous[part] = status
+    changed = None if regrade_all else changed_parts(repo, base)
+    if changed is None:
+        logger.info('Grading every part.')
+        changed = set(parts)
+    statuses = {}
+    for part in parts:
+        if part not in changed and part in previous:
+            if previous[part] == 0:
+                logger.info('✅ %s unchanged since %s; it passed.', part, base[:12])
+            else:
+                logger.error('❌ %s unchanged since %s; it failed.', part, base[:12])
+            statuses[part] = previous[part]
+            if gradebook and head:
+                gradebook.carry_forward(repo_name, part, base, head)
+            continue
+        logger.info('Grading %s', part)
+        proc = subprocess.run(['make', '-C', os.path.join(repo, part), 'test'], check=False)
+        statuses[part] = proc.returncode
+    if head:
+        save_state(repo, head, statuses)
+    return statuses
+
+
+def main():
+    """Main function; grade the changed parts of the repository in the
+    current directory."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--base', default=None,
+        help='commit to compare with (default: the last graded commit)',
+    )
+    parser.add_argument(
+        '--all', action='store_true', dest='regrade_all', help='grade every part'
+    )
+    args = parser.parse_args()
+    statuses = grade_changed(base=args.base, regrade_all=args.regrade_all)
+    sys.exit(1 if any(statuses.values()) else 0)
+
+
+if __name__ == '__main__':
+    main()
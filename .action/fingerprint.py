@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Fingerprints of the starter code. A fingerprint store is a sorted file
+    of fixed-size hashes of the starter files' normalized source, one per
+    file and one per function, so a submission's files can be classified
+    as unchanged or partially changed with a binary search instead of a
+    diff. The store is memory-mapped so grading processes share it. """
+
+import argparse
+import bisect
+import hashlib
+import mmap
+import os
+import os.path
+import sys
+import tempfile
+import threading
+from ccsrcutilities import cpp_tokens, glob_all_src_files, normalize_cpp_source
+from logger import setup_logger
+from resultcache import cache_key, cache_root, file_digest
+from sourcefile import source_file
+
+digest_size = 16
+
+
+def _fingerprint(kind, *parts):
+    hasher = hashlib.blake2b(kind.encode('utf-8'), digest_size=digest_size)
+    for part in parts:
+        hasher.update(b'\0')
+        hasher.update(part.encode('utf-8'))
+    return hasher.digest()
+
+
+def file_fingerprint(relative_path, text):
+    """Return the fingerprint of a whole file. The path relative to the
+    part's directory is included so a file only matches its own starter
+    file."""
+    return _fingerprint(
+        'file', os.path.normpath(relative_path), normalize_cpp_source(text)
+    )
+
+
+def function_bodies(text):
+    """Return the normalized text of each top-level function definition in
+    the C++ source text. A definition is a top-level brace block whose
+    declaration contains a parameter list, so class bodies and namespaces
+    are looked into rather than treated as functions."""
+    bodies = []
+    declaration = []
+    line_start = 0
+    body = []
+    depth = 0
+    for kind, token in cpp_tokens(text):
+        if kind in ('line_comment', 'block_comment', 'splice'):
+            continue
+        if depth == 0 and kind == 'newline':
+            # Preprocessor directives are not part of a declaration.
+            if ''.join(declaration[line_start:]).strip().startswith('#'):
+                del declaration[line_start:]
+            line_start = len(declaration)
+        if kind in ('space', 'newline'):
+            token = ' '
+        if depth == 0:
+            if token == '{' and '(' in ''.join(declaration):
+                body = [token]
+                depth = 1
+            elif token in ('{', '}', ';'):
+                declaration = []
+                line_start = 0
+            else:
+                declaration.append(token)
+            continue
+        body.append(token)
+        if token == '{':
+            depth += 1
+        elif token == '}':
+            depth -= 1
+            if depth == 0:
+                source = ''.join(declaration) + ''.join(body)
+                bodies.append(' '.join(source.split()))
+                declaration = []
+                line_start = 0
+    return bodies
+
+
+def function_fingerprints(text):
+    """Return the fingerprints of the functions defined in text."""
+    return [_fingerprint('function', body) for body in function_bodies(text)]
+
+
+class FingerprintStore:
+    """A read-only, memory-mapped, sorted array of fingerprints."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file_handle:
+            if os.fstat(file_handle.fileno()).st_size:
+                self._map = mmap.mmap(
+                    file_handle.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            else:
+                self._map = b''
+
+    def __len__(self):
+        return len(self._map) // digest_size
+
+    def __getitem__(self, index):
+        start = index * digest_size
+        return self._map[start:start + digest_size]
+
+    def __contains__(self, fingerprint):
+        index = bisect.bisect_left(self, fingerprint)
+        return index < len(self) and self[index] == fingerprint
+
+    def file_unchanged(self, relative_path, text):
+        """Return True if text matches the starter file at relative_path
+        once comments and whitespace are ignored."""
+        return file_fingerprint(relative_path, text) in self
+
+    def unchanged_functions(self, text):
+        """Return a tuple of the number of functions in text which appear
+        unchanged in the starter code and the number of functions."""
+        fingerprints = function_fingerprints(text)
+        return (sum(fp in self for fp in fingerprints), len(fingerprints))
+
+
+def build_fingerprint_store(base_directory, out_path):
+    """Fingerprint every C++ source file under base_directory and write the
+    sorted fingerprints to out_path. The file is replaced atomically."""
+    fingerprints = set()
+    for file in glob_all_src_files(base_directory):
+        text = source_file(file).contents
+        fingerprints.add(
+            file_fingerprint(os.path.relpath(file, base_directory), text)
+        )
+        fingerprints.update(function_fingerprints(text))
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    os.makedirs(out_dir, exist_ok=True)
+    handle, tmp_path = tempfile.mkstemp(dir=out_dir)
+    with os.fdopen(handle, 'wb') as file_handle:
+        file_handle.write(b''.join(sorted(fingerprints)))
+    os.replace(tmp_path, out_path)
+    return len(fingerprints)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def starter_fingerprints(base_directory):
+    """Return the FingerprintStore for the starter code in base_directory.
+    Set the environment variable MS_STARTER_FINGERPRINTS to the path of a
+    store made with build_fingerprint_store() to use it as is. Otherwise a
+    store is built in the grader's cache the first time the starter code is
+    seen. Each process maps a store once."""
+    path = os.environ.get('MS_STARTER_FINGERPRINTS')
+    if not path:
+        base_directory = os.path.abspath(base_directory)
+        starter_files = sorted(
+            (os.path.relpath(file, base_directory), file_digest(file))
+            for file in glob_all_src_files(base_directory)
+        )
+        path = os.path.join(
+            cache_root(), 'fingerprints', cache_key('v1', *starter_files) + '.fp'
+        )
+    with _stores_lock:
+        if path not in _stores:
+            if not os.path.exists(path):
+                setup_logger().debug(
+                    'Building starter code fingerprints for %s.', base_directory
+                )
+                build_fingerprint_store(base_directory, path)
+            _stores[path] = FingerprintStore(path)
+        return _stores[path]
+
+
+def main():
+    """Main function; build a fingerprint store from a starter code
+    directory."""
+    parser = argparse.ArgumentParser(
+        description='Fingerprint the starter code for the unchanged file check.'
+    )
+    parser.add_argument('base_directory', help='Directory of starter code')
+    parser.add_argument('output', help='Path of the fingerprint store to write')
+    args = parser.parse_args()
+    logger = setup_logger()
+    if not os.path.isdir(args.base_directory):
+        logger.error('No such directory %s.', args.base_directory)
+        sys.exit(1)
+    count = build_fingerprint_store(args.base_directory, args.output)
+    logger.info('Wrote %d fingerprints to %s.', count, args.output)
+
+
+if __name__ == '__main__':
+    main()
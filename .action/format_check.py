@@ -31,7 +31,7 @@ import sys
 import logging
 import os.path
 from logger import setup_logger
-from ccsrcutilities import format_check
+from ccsrcutilities import format_check_many
 
 def main():
     """ Main function; check the format of each file on the
@@ -41,12 +41,15 @@ def main():
         logger.warning('Only %s arguments provided.', len(sys.argv))
         logger.warning('Provide a list of files to check.')
     status = 0
+    in_files = [in_file for in_file in sys.argv[1:] if os.path.exists(in_file)]
+    # Check all the files with one clang-format process.
+    diffs = dict(zip(in_files, format_check_many(in_files)))
     for in_file in sys.argv[1:]:
         logger.info('Checking format for file: %s', in_file)
         if not os.path.exists(in_file):
             logger.debug('File %s does not exist. Continuing.', in_file)
             continue
-        diff = format_check(in_file)
+        diff = diffs[in_file]
         if len(diff) != 0:
             logger.warning("Error: Formatting needs improvement.")
             diff_string = 'Contextual Diff\n' + '\n'.join(diff)
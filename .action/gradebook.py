@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" A gradebook of every graded (repository, part, commit) kept in a SQLite
+    database in write-ahead logging mode, so many grading processes can
+    record results at once and class-wide queries do not need to read
+    thousands of gradelog CSV files. Columns are added as the gradelog
+    gains fields and the latest grade of each part can be exported as a
+    gradelog CSV file. Set the environment variable MS_GRADEBOOK to the
+    database's path to record grades in it. """
+
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from logger import setup_logger
+
+_key_fields = {'Repo Name': 'repo_name', 'Part': 'part'}
+_indexed_columns = ['author', 'partner1', 'partner2', 'partner3', 'status']
+
+
+def _gradelog_fields():
+    # assessment imports this module, so import it only when needed.
+    from assessment import gradelog_fields
+    return gradelog_fields
+
+
+def _column(field):
+    """Return the SQL column name for a gradelog field such as Lint Time."""
+    return _key_fields.get(field) or re.sub(r'\W+', '_', field.strip().lower())
+
+
+def repo_commit(directory):
+    """Return the commit checked out in directory or an empty string if it
+    is not a git repository."""
+    try:
+        proc = subprocess.run(
+            ['git', '-C', directory, 'rev-parse', 'HEAD'],
+            capture_output=True,
+            timeout=10,
+            check=False,
+            text=True,
+        )
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return ''
+    return proc.stdout.strip() if proc.returncode == 0 else ''
+
+
+class Gradebook:
+    """A gradebook database at path. Each process opens its own connection
+    the first time it is used."""
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._pid = None
+        self._fields = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=60, isolation_level=None, check_same_thread=False
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS grades ('
+                    ' repo_name TEXT NOT NULL, part TEXT NOT NULL,'
+                    " commit_hash TEXT NOT NULL DEFAULT '',"
+                    ' status INTEGER, graded_at REAL,'
+                    ' PRIMARY KEY (repo_name, part, commit_hash))'
+                )
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS fields ('
+                    ' position INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)'
+                )
+                connection.execute(
+                    'CREATE INDEX IF NOT EXISTS grades_status ON grades (status)'
+                )
+            self._connection = connection
+            self._pid = os.getpid()
+            self._fields = self._read_fields()
+            # Start with the gradelog's columns, in the gradelog's order.
+            missing = [field for field in _gradelog_fields() if field not in self._fields]
+            if missing:
+                self._add_fields(missing)
+        return self._connection
+
+    def _read_fields(self):
+        return [
+            name for (name,) in self._connection.execute(
+                'SELECT name FROM fields ORDER BY position'
+            )
+        ]
+
+    def _add_fields(self, fields):
+        """Add a column, and any index, for each of fields the table lacks
+        and rebuild the gradelog view over the columns."""
+        connection = self._connection
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            # Another process may have added some of the fields.
+            known = self._read_fields()
+            columns = {row[1] for row in connection.execute('PRAGMA table_info(grades)')}
+            for field in fields:
+                if field in known:
+                    continue
+                column = _column(field)
+                if column not in columns:
+                    connection.execute(f'ALTER TABLE grades ADD COLUMN "{column}" TEXT')
+                    columns.add(column)
+                if column in _indexed_columns:
+                    connection.execute(
+                        f'CREATE INDEX IF NOT EXISTS grades_{column} ON grades ("{column}")'
+                    )
+                connection.execute('INSERT INTO fields (name) VALUES (?)', (field,))
+                known.append(field)
+            selected = ', '.join(f'"{_column(field)}" AS "{field}"' for field in known)
+            connection.execute('DROP VIEW IF EXISTS gradelog')
+            # The view holds the latest grade of each part of each repository.
+            connection.execute(
+                f'CREATE VIEW gradelog AS SELECT {selected}, status AS "Status",'
+                ' commit_hash AS "Commit" FROM grades AS g WHERE graded_at ='
+                ' (SELECT MAX(graded_at) FROM grades'
+                ' WHERE repo_name = g.repo_name AND part = g.part)'
+            )
+        self._fields = known
+
+    def record(self, row, status, commit=''):
+        """Insert or replace the grade of row's repository and part at
+        commit. row is a gradelog row such as csv_solution_check returns."""
+        with self._lock:
+            connection = self._connect()
+            missing = [field for field in row if field not in self._fields]
+            if missing:
+                self._add_fields(missing)
+            columns = [_column(field) for field in row]
+            values = [
+                None if value is None else str(value) for value in row.values()
+            ]
+            names = ', '.join(f'"{column}"' for column in columns)
+            placeholders = ', '.join('?' for _ in columns)
+            updates = ', '.join(
+                f'"{column}" = excluded."{column}"'
+                for column in columns + ['status', 'graded_at']
+                if column not in ('repo_name', 'part')
+            )
+            connection.execute(
+                f'INSERT INTO grades ({names}, commit_hash, status, graded_at)'
+                f' VALUES ({placeholders}, ?, ?, ?)'
+                ' ON CONFLICT (repo_name, part, commit_hash) DO UPDATE SET '
+                + updates,
+                values + [commit, status, time.time()],
+            )
+
+    def carry_forward(self, repo_name, part, from_commit, to_commit):
+        """Record the grade of repo_name's part at from_commit as its grade
+        at to_commit, unless to_commit has already been graded."""
+        with self._lock:
+            connection = self._connect()
+            columns = ', '.join(
+                f'"{_column(field)}"' for field in self._fields
+                if _column(field) not in ('repo_name', 'part')
+            )
+            if columns:
+                columns = ', ' + columns
+            connection.execute(
+                f'INSERT OR IGNORE INTO grades (repo_name, part, commit_hash,'
+                f' status, graded_at{columns}) SELECT repo_name, part, ?,'
+                f' status, ?{columns} FROM grades WHERE repo_name = ?'
+                ' AND part = ? AND commit_hash = ?',
+                (to_commit, time.time(), repo_name, part, from_commit),
+            )
+
+    def status(self, repo_name, part, commit):
+        """Return the exit status recorded for repo_name's part at commit,
+        or None if it has not been graded."""
+        with self._lock:
+            connection = self._connect()
+            found = connection.execute(
+                'SELECT status FROM grades WHERE repo_name = ? AND part = ?'
+                ' AND commit_hash = ?',
+                (repo_name, part, commit),
+            ).fetchone()
+        return None if found is None or found[0] is None else int(found[0])
+
+    def rows(self, where='', parameters=()):
+        """Return the latest grade of each part as gradelog rows, optionally
+        filtered by an SQL where clause over the gradelog view's columns."""
+        with self._lock:
+            connection = self._connect()
+            if not self._fields:
+                return []
+            query = 'SELECT * FROM gradelog'
+            if where:
+                query += ' WHERE ' + where
+            cursor = connection.execute(
+                query + ' ORDER BY "Repo Name", "Part"', parameters
+            )
+            names = [description[0] for description in cursor.description]
+            return [dict(zip(names, values)) for values in cursor]
+
+    def export_csv(self, csv_path, fields=None, where='', parameters=()):
+        """Write the latest grade of each part to csv_path as a gradelog CSV
+        file with the given fields, which default to the gradelog's."""
+        rows = self.rows(where, parameters)
+        with open(csv_path, 'w') as csv_output_handle:
+            outcsv = csv.DictWriter(
+                csv_output_handle, fields or _gradelog_fields(), extrasaction='ignore'
+            )
+            outcsv.writeheader()
+            for row in rows:
+                outcsv.writerow(row)
+        return len(rows)
+
+
+_gradebooks = {}
+_gradebooks_lock = threading.Lock()
+
+
+def open_gradebook(path):
+    """Return the Gradebook at path, shared within the process."""
+    with _gradebooks_lock:
+        if path not in _gradebooks:
+            _gradebooks[path] = Gradebook(path)
+        return _gradebooks[path]
+
+
+def default_gradebook():
+    """Return the Gradebook named by the environment variable MS_GRADEBOOK
+    or None if it is not set."""
+    path = os.environ.get('MS_GRADEBOOK')
+    return open_gradebook(path) if path else None
+
+
+def main():
+    """Main function; export the latest grades from a gradebook."""
+    parser = argparse.ArgumentParser(description='Export grades from a gradebook.')
+    parser.add_argument('gradebook', help='gradebook database')
+    parser.add_argument(
+        '-o', '--output', default='gradelog.csv',
+        help='gradelog CSV file to write (default: gradelog.csv)',
+    )
+    parser.add_argument('--author', help='only the grades of this author')
+    parser.add_argument('--partner', help='only the grades with this partner')
+    parser.add_argument('--failed', action='store_true', help='only failing grades')
+    args = parser.parse_args()
+    logger = setup_logger()
+    if not os.path.exists(args.gradebook):
+        logger.error('No such gradebook %s.', args.gradebook)
+        sys.exit(1)
+    clauses = []
+    parameters = []
+    if args.author:
+        clauses.append('"Author" = ?')
+        parameters.append(args.author)
+    if args.partner:
+        clauses.append('? IN ("Partner1", "Partner2", "Partner3")')
+        parameters.append(args.partner)
+    if args.failed:
+        clauses.append('"Status" != 0')
+    count = Gradebook(args.gradebook).export_csv(
+        args.output, where=' AND '.join(clauses), parameters=parameters
+    )
+    logger.info('Wrote %d rows to %s', count, args.output)
+
+
+if __name__ == '__main__':
+    main()
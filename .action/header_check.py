@@ -43,6 +43,7 @@ import sys
 import logging
 from logger import setup_logger
 from parse_header import dict_header
+from sourcefile import source_file
 
 def header_check(file):
     """ Check file's header if it conforms to the standard given \
@@ -63,16 +64,14 @@ def header_check(file):
     #//
 
     # return true if header is good
-    keys = ['name', 'class', 'email', 'github', 'asgt', 'partners', 'comment']
-    with open(file) as file_handle:
-        contents = file_handle.read()
-    header = dict_header(contents, silent=True)
+    # The file may be a path or a SourceFile; either way the header is
+    # parsed only once.
+    source = source_file(file)
     status = True
-    if header:
-        for k in keys:
-            if not k in header.keys():
-                logging.warning('%s: missing %s', file, k)
-                status = False
+    if source.header:
+        for k in source.missing_header_keys:
+            logging.warning('%s: missing %s', source, k)
+            status = False
     else:
         status = False
     return status
@@ -98,9 +97,7 @@ def get_header_and_check(file):
 
     # return true if header is good
     keys = ['name', 'class', 'email', 'github', 'asgt', 'partners', 'comment']
-    with open(file) as file_handle:
-        contents = file_handle.read()
-    header = dict_header(contents)
+    header = dict_header(source_file(file).contents)
     status = True
     if header:
         for k in keys:
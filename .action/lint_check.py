@@ -31,7 +31,7 @@ import sys
 import logging
 import os.path
 from logger import setup_logger
-from ccsrcutilities import lint_check
+from ccsrcutilities import lint_check_many
 
 
 def main():
@@ -41,46 +41,49 @@ def main():
         logger.warning('Only %s arguments provided.', len(sys.argv))
         logger.warning('Provide a list of files to check.')
     status = 0
+    tidy_opts = (
+        '-checks="*,-misc-unused-parameters,'
+        '-modernize-use-trailing-return-type,-google-build-using-namespace,'
+        '-cppcoreguidelines-avoid-magic-numbers,-readability-magic-numbers,'
+        '-fuchsia-default-arguments-calls,-clang-analyzer-deadcode.DeadStores,'
+        '-bugprone-exception-escape"'
+        ' -config="{CheckOptions: [{key: readability-identifier-naming.ClassCase, value: CamelCase}, '
+        '{key: readability-identifier-naming.ClassMemberCase, value: lower_case}, '
+        '{key: readability-identifier-naming.ConstexprVariableCase, value: CamelCase}, '
+        '{key: readability-identifier-naming.ConstexprVariablePrefix, value: k}, '
+        '{key: readability-identifier-naming.EnumCase, value: CamelCase}, '
+        '{key: readability-identifier-naming.EnumConstantCase, value: CamelCase}, '
+        '{key: readability-identifier-naming.EnumConstantPrefix, value: k}, '
+        '{key: readability-identifier-naming.FunctionCase, value: CamelCase}, '
+        '{key: readability-identifier-naming.GlobalConstantCase, value: CamelCase}, '
+        '{key: readability-identifier-naming.GlobalConstantPrefix, value: k}, '
+        '{key: readability-identifier-naming.StaticConstantCase, value: CamelCase}, '
+        '{key: readability-identifier-naming.StaticConstantPrefix, value: k}, '
+        '{key: readability-identifier-naming.StaticVariableCase, value: lower_case}, '
+        '{key: readability-identifier-naming.MacroDefinitionCase, value: UPPER_CASE}, '
+        '{key: readability-identifier-naming.MacroDefinitionIgnoredRegexp, value: \'^[A-Z]+(_[A-Z]+)*_$\'}, '
+        '{key: readability-identifier-naming.MemberCase, value: lower_case}, '
+        '{key: readability-identifier-naming.PrivateMemberSuffix, value: _}, '
+        '{key: readability-identifier-naming.PublicMemberSuffix, value: \'\'}, '
+        '{key: readability-identifier-naming.NamespaceCase, value: lower_case}, '
+        '{key: readability-identifier-naming.ParameterCase, value: lower_case}, '
+        '{key: readability-identifier-naming.TypeAliasCase, value: CamelCase}, '
+        '{key: readability-identifier-naming.TypedefCase, value: CamelCase}, '
+        '{key: readability-identifier-naming.VariableCase, value: lower_case}, '
+        '{key: readability-identifier-naming.IgnoreMainLikeFunctions, value: 1}]}"'
+    )
+    in_files = [in_file for in_file in sys.argv[1:] if os.path.exists(in_file)]
+    # Lint all the files together so shared headers are analyzed once.
+    all_lint_warnings = dict(zip(in_files, lint_check_many(in_files, tidy_opts)))
     for in_file in sys.argv[1:]:
         logger.info('Linting file: %s', in_file)
         if not os.path.exists(in_file):
             logger.debug('File %s does not exist. Continuing.', in_file)
             continue
-        tidy_opts = (
-            '-checks="*,-misc-unused-parameters,'
-            '-modernize-use-trailing-return-type,-google-build-using-namespace,'
-            '-cppcoreguidelines-avoid-magic-numbers,-readability-magic-numbers,'
-            '-fuchsia-default-arguments-calls,-clang-analyzer-deadcode.DeadStores,'
-            '-bugprone-exception-escape"'
-            ' -config="{CheckOptions: [{key: readability-identifier-naming.ClassCase, value: CamelCase}, '
-            '{key: readability-identifier-naming.ClassMemberCase, value: lower_case}, '
-            '{key: readability-identifier-naming.ConstexprVariableCase, value: CamelCase}, '
-            '{key: readability-identifier-naming.ConstexprVariablePrefix, value: k}, '
-            '{key: readability-identifier-naming.EnumCase, value: CamelCase}, '
-            '{key: readability-identifier-naming.EnumConstantCase, value: CamelCase}, '
-            '{key: readability-identifier-naming.EnumConstantPrefix, value: k}, '
-            '{key: readability-identifier-naming.FunctionCase, value: CamelCase}, '
-            '{key: readability-identifier-naming.GlobalConstantCase, value: CamelCase}, '
-            '{key: readability-identifier-naming.GlobalConstantPrefix, value: k}, '
-            '{key: readability-identifier-naming.StaticConstantCase, value: CamelCase}, '
-            '{key: readability-identifier-naming.StaticConstantPrefix, value: k}, '
-            '{key: readability-identifier-naming.StaticVariableCase, value: lower_case}, '
-            '{key: readability-identifier-naming.MacroDefinitionCase, value: UPPER_CASE}, '
-            '{key: readability-identifier-naming.MacroDefinitionIgnoredRegexp, value: \'^[A-Z]+(_[A-Z]+)*_$\'}, '
-            '{key: readability-identifier-naming.MemberCase, value: lower_case}, '
-            '{key: readability-identifier-naming.PrivateMemberSuffix, value: _}, '
-            '{key: readability-identifier-naming.PublicMemberSuffix, value: \'\'}, '
-            '{key: readability-identifier-naming.NamespaceCase, value: lower_case}, '
-            '{key: readability-identifier-naming.ParameterCase, value: lower_case}, '
-            '{key: readability-identifier-naming.TypeAliasCase, value: CamelCase}, '
-            '{key: readability-identifier-naming.TypedefCase, value: CamelCase}, '
-            '{key: readability-identifier-naming.VariableCase, value: lower_case}, '
-            '{key: readability-identifier-naming.IgnoreMainLikeFunctions, value: 1}]}"'
-        )
-        lint_warnings = lint_check(in_file, tidy_opts)
+        lint_warnings = all_lint_warnings[in_file]
         if len(lint_warnings) != 0:
                 logger.error('Linter found improvements.')
-                logger.warning('\n'.join(lint_warnings))
+                logger.warning('\n'.join(str(warning) for warning in lint_warnings))
                 status = 1
                 logger.error("🤯😳😤😫🤬")
                 logger.error("Use the output from this program to help guide you.")
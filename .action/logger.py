@@ -26,24 +26,142 @@
 """ Local logger setup. Used across all the different bits and pieces
     in the GitHub actions. """
 
+import atexit
+import contextlib
+import contextvars
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import sys
 
 mshafae_logger = None
+_listener = None
+_queue_handler = None
+_logger_pid = None
+
+# Fields such as repo, part and stage which describe the current job.
+_log_context = contextvars.ContextVar('log_context', default={})
+
+
+class ContextFilter(logging.Filter):
+    """Attach the current job's context to each log record."""
+
+    def filter(self, record):
+        record.context = _log_context.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Format each record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'context', {}))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry)
+
+
+_traceback_formatter = logging.Formatter()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queue records with their message merged but not formatted, so the
+    listener's formatter still sees the traceback of an exception."""
+
+    def prepare(self, record):
+        # The arguments may change after the call returns, so merge them
+        # now. The traceback is kept as text rather than holding frames.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class LazyJoin:
+    """Join lines only if the message is actually logged. Use as
+    logger.debug('%s', LazyJoin(lines)) for large payloads."""
+
+    __slots__ = ('lines', 'separator')
+
+    def __init__(self, lines, separator='\n'):
+        self.lines = lines
+        self.separator = separator
+
+    def __str__(self):
+        return self.separator.join(str(line) for line in self.lines)
+
+
+@contextlib.contextmanager
+def log_context(**fields):
+    """Add fields such as repo, part or stage to every record logged
+    within the block."""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def set_log_context(**fields):
+    """Update the current context until the enclosing log_context block
+    ends, e.g. to name the stage which is starting."""
+    _log_context.set({**_log_context.get(), **fields})
+
+
+def flush_logger():
+    """Wait until every queued record has been written."""
+    if _listener and _logger_pid == os.getpid():
+        _listener.stop()
+        _listener.start()
+
 
 def setup_logger():
-    """Set up the logger to output to stdout."""
+    """Set up the logger to output to stdout. Records are passed through a
+    queue to a listener thread which writes them, so the threads doing the
+    work never wait on stdout. Set the environment variable MS_LOG_FORMAT
+    to json for one JSON object per line."""
     # https://docs.python.org/3/howto/logging.html#logging-basic-tutorial
     # https://stackoverflow.com/questions/14058453/making-python-loggers-output-all-messages-to-stdout-in-addition-to-log-file
     # root = logging.getLogger()
-    global mshafae_logger
-    if not mshafae_logger:
+    global mshafae_logger, _listener, _queue_handler, _logger_pid
+    # A forked worker process inherits the logger but not the listener
+    # thread, so it needs a listener of its own.
+    if not mshafae_logger or _logger_pid != os.getpid():
       logger = logging.getLogger()
       logger.setLevel(logging.INFO)
       handler = logging.StreamHandler(sys.stdout)
       handler.setLevel(logging.INFO)
-      formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+      if os.environ.get('MS_LOG_FORMAT') == 'json':
+          formatter = JsonFormatter()
+      else:
+          formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
       handler.setFormatter(formatter)
-      logger.addHandler(handler)
+      if _queue_handler:
+          logger.removeHandler(_queue_handler)
+      log_queue = queue.SimpleQueue()
+      _queue_handler = _QueueHandler(log_queue)
+      _queue_handler.addFilter(ContextFilter())
+      _listener = logging.handlers.QueueListener(
+          log_queue, handler, respect_handler_level=True
+      )
+      _listener.start()
+      if _logger_pid is None:
+          atexit.register(lambda: _listener.stop())
+      _logger_pid = os.getpid()
+      logger.addHandler(_queue_handler)
       mshafae_logger = logger
     return mshafae_logger
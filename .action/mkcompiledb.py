@@ -35,29 +35,37 @@ import logging
 from logger import setup_logger
 
 
-def create_clang_compile_commands_db(
-    files=None, remove_existing_db=False, compile_cmd=None
-):
-    """Create a Clang compile commands DB named
-    compile_commands.json in the current working directory."""
-    out = 'compile_commands.json'
+def platform_compile_cmd(compile_cmd):
+    """Return compile_cmd with the standard library include flags this
+    platform's compile commands DB adds."""
     linux_includes = ' -I/usr/include/c++/9/'
     darwin_includes = ' -D OSX -nostdinc++ -I/opt/local/include/libcxx/v1'
     my_platform = platform.system()
-    logger = setup_logger()
-    if not compile_cmd:
-        compile_cmd = 'clang++ -g -O3 -Wall -pipe -std=c++14'
     if my_platform == 'Linux':
         compile_cmd = compile_cmd + linux_includes
     elif my_platform == 'Darwin':
         compile_cmd = compile_cmd + darwin_includes
+    return compile_cmd
+
+
+def create_clang_compile_commands_db(
+    files=None, remove_existing_db=False, compile_cmd=None, out_dir='.'
+):
+    """Create a Clang compile commands DB named
+    compile_commands.json in out_dir, which defaults to the current
+    working directory."""
+    out = os.path.join(out_dir, 'compile_commands.json')
+    logger = setup_logger()
+    if not compile_cmd:
+        compile_cmd = 'clang++ -g -O3 -Wall -pipe -std=c++14'
+    compile_cmd = platform_compile_cmd(compile_cmd)
     if not files:
         files = glob.glob('*.cc')
     compile_commands_db = [
         {
-            'directory': '/tmp',
-            'command': '{} {}'.format(compile_cmd, f),
-            'file': f,
+            'directory': os.path.dirname(os.path.abspath(f)),
+            'command': '{} {}'.format(compile_cmd, os.path.abspath(f)),
+            'file': os.path.abspath(f),
         }
         for f in files
     ]
@@ -0,0 +1,153 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" A shared cache of precompiled headers for the standard library headers
+    the labs include. A precompiled header is built once for each compiler
+    version, set of compiler flags and list of headers, then reused by
+    every build and lint run with the same settings. Set the environment
+    variable MS_PCH to 1 to use precompiled headers. """
+
+import functools
+import os
+import os.path
+import re
+import shlex
+import subprocess
+import tempfile
+import threading
+from logger import setup_logger
+from resultcache import cache_key, cache_root, tool_version
+from sandbox import run_sandboxed
+from sourcefile import source_file
+
+_system_include_regex = re.compile(r'^\s*#\s*include\s*<([\w./+-]+)>', re.MULTILINE)
+
+
+def pch_enabled():
+    """Return True if precompiled headers are turned on."""
+    return os.environ.get('MS_PCH') == '1'
+
+
+def system_includes(files):
+    """Return the <...> headers included by every one of files, in the
+    order the first file includes them. Headers only some files include
+    are left out so no file sees a header it did not include itself."""
+    include_lists = []
+    for file in files:
+        try:
+            include_lists.append(_system_include_regex.findall(source_file(file).contents))
+        except (FileNotFoundError, UnicodeDecodeError):
+            continue
+    if not include_lists:
+        return []
+    common = set(include_lists[0]).intersection(*include_lists[1:])
+    return [header for header in dict.fromkeys(include_lists[0]) if header in common]
+
+
+@functools.lru_cache(maxsize=None)
+def llvm_version(tool):
+    """Return the LLVM version, such as 14.0.0, reported by tool --version
+    or None if there is none."""
+    try:
+        proc = subprocess.run(
+            [tool, '--version'], capture_output=True, timeout=10, check=False, text=True
+        )
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return None
+    matches = re.search(r'version (\d+\.\d+\.\d+)', proc.stdout)
+    return matches.group(1) if matches else None
+
+
+def _is_clang(compiler):
+    return 'clang' in (tool_version(compiler) or compiler)
+
+
+def pch_usable_for_lint(compiler, tidy='clang-tidy'):
+    """Return True if clang-tidy can read precompiled headers built by
+    compiler, which needs both to be the same release of clang."""
+    version = llvm_version(compiler)
+    return _is_clang(compiler) and version is not None and version == llvm_version(tidy)
+
+
+_built = {}
+_built_lock = threading.Lock()
+
+
+def precompiled_header_flags(compile_cmd, files):
+    """Return the compiler flags which use a precompiled header of the
+    standard headers all of files include, for compiling with compile_cmd,
+    such as 'clang++ -O3 -std=c++17'. The header is built the first time
+    and an empty string is returned if it cannot be built."""
+    args = shlex.split(compile_cmd)
+    headers = system_includes(files)
+    if not args or not headers:
+        return ''
+    compiler = args[0]
+    key = cache_key('pch', tool_version(compiler), compile_cmd, *headers)
+    directory = os.path.join(cache_root(), 'pch')
+    header = os.path.join(directory, key + '.h')
+    if _is_clang(compiler):
+        # clang reads the header's precompiled form only when told to.
+        output = os.path.join(directory, key + '.pch')
+        flags = '-include-pch ' + shlex.quote(output)
+    else:
+        # GCC looks for header.gch beside the header and falls back to the
+        # header itself if the precompiled one does not fit.
+        output = header + '.gch'
+        flags = '-include ' + shlex.quote(header)
+    with _built_lock:
+        if key not in _built:
+            _built[key] = os.path.exists(output) or _build_pch(
+                args, headers, header, output
+            )
+        return flags if _built[key] else ''
+
+
+def _build_pch(args, headers, header, output):
+    """Write header including headers and compile it to output."""
+    logger = setup_logger()
+    directory = os.path.dirname(header)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(header):
+            handle, tmp_path = tempfile.mkstemp(dir=directory, suffix='.h')
+            with os.fdopen(handle, 'w') as file_handle:
+                file_handle.writelines(f'#include <{name}>\n' for name in headers)
+            os.replace(tmp_path, header)
+        handle, tmp_output = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        os.close(handle)
+    except OSError as exception:
+        logger.debug('Cannot write precompiled header: %s', exception)
+        return False
+    result = run_sandboxed(
+        args + ['-x', 'c++-header', header, '-o', tmp_output], timeout=120
+    )
+    if result.returncode != 0:
+        logger.debug('Cannot build precompiled header: %s', result.stderr)
+        os.unlink(tmp_output)
+        return False
+    os.replace(tmp_output, output)
+    logger.debug('Built precompiled header %s for %s', output, ' '.join(headers))
+    return True
@@ -0,0 +1,110 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Measure how a student's program scales with the size of its input.
+    The program is run on inputs of increasing size and the wall time
+    and CPU time of each run are read from the kernel's resource usage
+    for the child. A line fitted to log(time) against
+    log(size) gives the scaling exponent, about 1 for a linear and 2 for
+    a quadratic implementation. """
+
+import collections
+import math
+import os
+import os.path
+from logger import setup_logger
+from sandbox import run_sandboxed
+
+Measurement = collections.namedtuple(
+    'Measurement', ['size', 'wall', 'cpu', 'returncode']
+)
+Measurement.__doc__ = """One run of a program. Times are in seconds. The
+peak memory is not kept because it cannot be told apart from the
+grader's; see SandboxResult."""
+
+
+def measure_run(binary, args, cwd=None, timeout=10):
+    """Run binary with args in the sandbox, discarding its output, and
+    return a Measurement with a size of 0. A run which exceeds timeout
+    seconds is killed with its process group."""
+    result = run_sandboxed(
+        [os.path.abspath(binary)] + list(args),
+        cwd=cwd,
+        timeout=timeout,
+        capture_output=False,
+    )
+    return Measurement(0, result.wall, result.cpu, result.returncode)
+
+
+def scaling_exponent(measurements):
+    """Return the slope of the least squares line through log(cpu time)
+    against log(size), or None if the runs are too fast to tell. The
+    smallest input's time is taken as the program's fixed start up cost
+    and subtracted, and only runs which take at least twice as long are
+    fitted."""
+    if not measurements:
+        return None
+    baseline = min(measurements, key=lambda m: m.size).cpu
+    points = [
+        (math.log(m.size), math.log(m.cpu - baseline))
+        for m in measurements
+        if m.size > 0 and m.cpu >= 2 * baseline and m.cpu > baseline
+    ]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if spread == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+def profile_scaling(binary, corpus, repeat=3, timeout=10):
+    """Run binary on each (size, args) pair in corpus, smallest first, and
+    return a tuple of the scaling exponent and the list of Measurements.
+    Each input is run repeat times and the fastest run is kept. Profiling
+    stops at the first run which fails or times out."""
+    logger = setup_logger()
+    cwd = os.path.dirname(os.path.abspath(binary))
+    measurements = []
+    for size, args in sorted(corpus):
+        runs = [measure_run(binary, args, cwd, timeout) for _ in range(repeat)]
+        best = min(runs, key=lambda m: m.cpu)._replace(size=size)
+        logger.info(
+            'Size %d: %.3fs wall, %.3fs CPU',
+            size, best.wall, best.cpu,
+        )
+        if any(m.returncode != 0 for m in runs):
+            logger.warning('Profiling stopped; the run of size %d failed.', size)
+            break
+        measurements.append(best)
+    return (scaling_exponent(measurements), measurements)
+
+
+def count_lines(file):
+    """Return the number of lines in file."""
+    with open(file, 'rb') as file_handle:
+        return sum(1 for _ in file_handle)
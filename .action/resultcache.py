@@ -0,0 +1,202 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" An on-disk, content-addressed cache for the results of slow checks
+    such as clang-format and clang-tidy. Entries are keyed on a hash of
+    everything that determines the result and the least recently used
+    entries are evicted when the cache grows past its size limit. """
+
+import functools
+import hashlib
+import json
+import os
+import os.path
+import subprocess
+import tempfile
+import threading
+from logger import setup_logger
+
+
+def cache_root():
+    """Return the directory which holds all the grader's caches. Set the
+    environment variable MS_GRADER_CACHE_DIR to override the default."""
+    root = os.environ.get('MS_GRADER_CACHE_DIR')
+    if not root:
+        xdg_cache = os.environ.get(
+            'XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')
+        )
+        root = os.path.join(xdg_cache, 'cpsc-grader')
+    return root
+
+
+@functools.lru_cache(maxsize=None)
+def tool_version(tool):
+    """Return the first line of `tool --version`, or None if the tool
+    cannot be run. The answer is memoized for the life of the process."""
+    version = None
+    try:
+        proc = subprocess.run(
+            [tool, '--version'],
+            capture_output=True,
+            timeout=10,
+            check=False,
+            text=True,
+        )
+        lines = [line for line in proc.stdout.splitlines() if line.strip()]
+        if proc.returncode == 0 and lines:
+            version = lines[0].strip()
+    except (FileNotFoundError, subprocess.TimeoutExpired) as exception:
+        setup_logger().debug('Cannot determine version of %s: %s', tool, exception)
+    return version
+
+
+def cache_key(*parts):
+    """Combine the given parts into a single hex digest."""
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(str(part).encode('utf-8'))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+
+def file_digest(file):
+    """Return the SHA-256 hex digest of the contents of file."""
+    hasher = hashlib.sha256()
+    with open(file, 'rb') as file_handle:
+        for block in iter(lambda: file_handle.read(1 << 16), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class ResultCache:
+    """A directory of cache entries bounded to max_bytes in total. Reading
+    an entry refreshes its modification time which is used to find the
+    least recently used entries to evict. Writes are atomic so several
+    grading processes may share one cache."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """Return the bytes stored under key or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file_handle:
+                data = file_handle.read()
+            os.utime(path)
+        except OSError:
+            data = None
+        return data
+
+    def put(self, key, data):
+        """Store the bytes data under key."""
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(handle, 'wb') as file_handle:
+                file_handle.write(data)
+            os.replace(tmp_path, path)
+        except OSError as exception:
+            setup_logger().debug('Cannot write cache entry %s: %s', path, exception)
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def get_json(self, key):
+        """Return the object stored as JSON under key or None on a miss."""
+        data = self.get(key)
+        if data is not None:
+            try:
+                data = json.loads(data.decode('utf-8'))
+            except ValueError:
+                data = None
+        return data
+
+    def put_json(self, key, value):
+        """Store value as JSON under key."""
+        self.put(key, json.dumps(value).encode('utf-8'))
+
+    def _entries(self):
+        entries = []
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache is at
+        most three quarters full. Other processes may evict concurrently so
+        missing files are ignored."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        budget = self.max_bytes * 3 // 4
+        for _, size, path in entries:
+            if total <= budget:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+        self._size = total
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def result_cache(name):
+    """Return the shared ResultCache called name, or None if caching is
+    disabled by setting the environment variable MS_GRADER_CACHE to 0. The
+    size limit in megabytes is read from MS_GRADER_CACHE_SIZE."""
+    if os.environ.get('MS_GRADER_CACHE', '1') == '0':
+        return None
+    with _caches_lock:
+        if name not in _caches:
+            max_megabytes = int(os.environ.get('MS_GRADER_CACHE_SIZE', '256'))
+            _caches[name] = ResultCache(
+                os.path.join(cache_root(), name), max_megabytes * 1024 * 1024
+            )
+        return _caches[name]
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" The class roster which maps GitHub logins to students' names. The
+    roster is a small SQLite database indexed on the login, compared
+    without regard to case, and opened read-only once per process so
+    looking up a partner does not load the whole class. A roster is built
+    from the MS_GITUSER_PICKLE file, a pickled dict which maps each login
+    to a (last name, first name) pair. """
+
+import argparse
+import os
+import os.path
+import pickle
+import sqlite3
+import sys
+import tempfile
+import threading
+from logger import setup_logger
+from resultcache import cache_root, file_digest
+
+
+def build_roster(pickle_path, roster_path):
+    """Write a roster database to roster_path from the pickled dict of
+    logins at pickle_path. The database is replaced atomically. Returns
+    the number of students."""
+    with open(pickle_path, 'rb') as file_handle:
+        # The students file contains only one dict
+        students = pickle.load(file_handle)
+    out_dir = os.path.dirname(os.path.abspath(roster_path))
+    os.makedirs(out_dir, exist_ok=True)
+    handle, tmp_path = tempfile.mkstemp(dir=out_dir, suffix='.sqlite')
+    os.close(handle)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        with connection:
+            connection.execute(
+                'CREATE TABLE students (login TEXT PRIMARY KEY COLLATE NOCASE,'
+                ' last_name TEXT, first_name TEXT) WITHOUT ROWID'
+            )
+            connection.executemany(
+                'INSERT OR REPLACE INTO students VALUES (?, ?, ?)',
+                (
+                    (login, name[0], name[1])
+                    for login, name in students.items()
+                ),
+            )
+    finally:
+        connection.close()
+    os.replace(tmp_path, roster_path)
+    return len(students)
+
+
+class Roster:
+    """A read-only roster database. Each process opens its own connection
+    the first time a login is looked up."""
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def lookup(self, login):
+        """Return the (last name, first name) of the student with the GitHub
+        login, ignoring case, or None if there is no such student."""
+        with self._lock:
+            if self._connection is None or self._pid != os.getpid():
+                self._connection = sqlite3.connect(
+                    f'file:{self.path}?mode=ro&immutable=1',
+                    uri=True,
+                    check_same_thread=False,
+                )
+                self._connection.execute('PRAGMA mmap_size = 268435456')
+                self._pid = os.getpid()
+            name = self._connection.execute(
+                'SELECT last_name, first_name FROM students WHERE login = ?',
+                (login,),
+            ).fetchone()
+        return name
+
+
+_rosters = {}
+# (pickle path, inode, size, modification time) -> roster path
+_roster_paths = {}
+_rosters_lock = threading.Lock()
+
+
+def student_roster():
+    """Return the class Roster or None if there is none. The environment
+    variable MS_ROSTER names a roster database made by build_roster().
+    Otherwise a roster is built in the grader's cache from the
+    MS_GITUSER_PICKLE file the first time that file is seen."""
+    path = os.environ.get('MS_ROSTER')
+    if not path:
+        pickle_path = os.environ.get('MS_GITUSER_PICKLE')
+        if not pickle_path:
+            return None
+        stat = os.stat(pickle_path)
+        # Hash the pickle only the first time this process sees this
+        # version of it.
+        version = (pickle_path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with _rosters_lock:
+            path = _roster_paths.get(version)
+            if path is None:
+                path = os.path.join(
+                    cache_root(), 'roster', file_digest(pickle_path) + '.sqlite'
+                )
+                if not os.path.exists(path):
+                    setup_logger().info('Indexing student information')
+                    build_roster(pickle_path, path)
+                _roster_paths[version] = path
+    with _rosters_lock:
+        if path not in _rosters:
+            _rosters[path] = Roster(path)
+        return _rosters[path]
+
+
+def main():
+    """Main function; build a roster database from a pickled dict of
+    logins."""
+    parser = argparse.ArgumentParser(
+        description='Build a roster database from a pickled dict of GitHub logins.'
+    )
+    parser.add_argument('pickle', help='pickled dict of logins to (last, first) names')
+    parser.add_argument('roster', help='roster database to write')
+    args = parser.parse_args()
+    logger = setup_logger()
+    if not os.path.exists(args.pickle):
+        logger.error('No such file %s.', args.pickle)
+        sys.exit(1)
+    count = build_roster(args.pickle, args.roster)
+    logger.info('Wrote %d students to %s.', count, args.roster)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,420 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Run student code and Makefiles with resource limits. Each command runs
+    in its own session, and so its own process group, with CPU, memory and
+    file size limits applied by prlimit, or by the shell's ulimit when
+    prlimit is not installed, which then execs the command. The number of
+    processes is limited per command by a pids cgroup of its own when the
+    grader can create one. No Python runs in the forked child, which is not
+    safe when the grader has threads. On timeout the whole process group
+    is killed so runaway grandchildren cannot outlive the job. The CPU time
+    and peak memory used are reported from the kernel's accounting. """
+
+import collections
+import contextlib
+import itertools
+import os
+import resource
+import select
+import selectors
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from logger import setup_logger
+
+Limits = collections.namedtuple(
+    'Limits', ['cpu', 'memory', 'file_size', 'processes']
+)
+Limits.__doc__ = """Resource limits for a sandboxed command. cpu is in seconds
+of CPU time per process, memory and file_size are in bytes and processes
+is the number of processes and threads the command may have at once.
+None means unlimited."""
+
+SandboxResult = collections.namedtuple(
+    'SandboxResult',
+    ['returncode', 'stdout', 'stderr', 'timed_out', 'wall', 'cpu', 'max_rss'],
+)
+SandboxResult.__doc__ = """The outcome of a sandboxed command. wall and cpu
+are in seconds; cpu includes the children the command waited for. max_rss
+is the peak resident set size in kilobytes. Linux carries the peak of the
+process which was forked over exec, so max_rss is never below the
+grader's own size and only peaks above it are meaningful."""
+
+
+def _env_limit(name, default, scale=1):
+    value = int(os.environ.get(name, default))
+    return value * scale if value > 0 else None
+
+
+def default_limits():
+    """Return the Limits set by the environment variables MS_SANDBOX_CPU
+    in seconds (default 60), MS_SANDBOX_MEMORY in megabytes (default 2048),
+    MS_SANDBOX_FILE_SIZE in megabytes (default 64) and
+    MS_SANDBOX_PROCESSES (default 256). A value of 0 removes the limit."""
+    megabyte = 1024 * 1024
+    return Limits(
+        cpu=_env_limit('MS_SANDBOX_CPU', 60),
+        memory=_env_limit('MS_SANDBOX_MEMORY', 2048, megabyte),
+        file_size=_env_limit('MS_SANDBOX_FILE_SIZE', 64, megabyte),
+        processes=_env_limit('MS_SANDBOX_PROCESSES', 256),
+    )
+
+
+def _clamp(which, soft, hard):
+    # An unprivileged process cannot raise its hard limit, and the command
+    # inherits this process's limits.
+    _, current_hard = resource.getrlimit(which)
+    if current_hard != resource.RLIM_INFINITY:
+        soft = min(soft, current_hard)
+        hard = min(hard, current_hard)
+    return (soft, hard)
+
+
+def sandbox_prefix(limits=None):
+    """Return the arguments to put before a command so that it runs with
+    limits applied as resource limits. The hard CPU limit is a second past
+    the soft limit so the process gets SIGXCPU before it is killed. The
+    process limit becomes RLIMIT_NPROC, which counts every process the
+    user owns; sandbox() only passes it on when the grader runs as a
+    dedicated user. Without prlimit the process limit is not applied, as
+    ulimit has no portable option for it."""
+    if limits is None:
+        limits = default_limits()
+    settings = []
+    if limits.cpu:
+        settings.append(('cpu', _clamp(resource.RLIMIT_CPU, limits.cpu, limits.cpu + 1)))
+    if limits.memory:
+        settings.append(('as', _clamp(resource.RLIMIT_AS, limits.memory, limits.memory)))
+    if limits.file_size:
+        settings.append(
+            ('fsize', _clamp(resource.RLIMIT_FSIZE, limits.file_size, limits.file_size))
+        )
+    if limits.processes:
+        settings.append(
+            ('nproc', _clamp(resource.RLIMIT_NPROC, limits.processes, limits.processes))
+        )
+    if not settings:
+        return []
+    prlimit = shutil.which('prlimit')
+    if prlimit:
+        return [prlimit] + [f'--{name}={soft}:{hard}' for name, (soft, hard) in settings] + ['--']
+    # ulimit takes memory in kilobytes and file sizes in 512 byte blocks.
+    ulimit = {'cpu': ('-t', 1), 'as': ('-v', 1024), 'fsize': ('-f', 512)}
+    commands = []
+    for name, (soft, hard) in settings:
+        if name in ulimit:
+            option, unit = ulimit[name]
+            commands.append(f'ulimit -S {option} {soft // unit}')
+            commands.append(f'ulimit -H {option} {hard // unit}')
+    return ['/bin/sh', '-c', '; '.join(commands + ['exec "$@"']), 'sh']
+
+
+_cgroup_lock = threading.Lock()
+_cgroup_parent = None
+_cgroup_numbers = itertools.count()
+_warned_no_process_limit = False
+
+
+def _cgroup_directories():
+    """Yield the directories of this process's own cgroups which may limit
+    the number of processes: the cgroup v1 pids hierarchy, then the cgroup
+    v2 unified hierarchy."""
+    mounts = {}
+    with open('/proc/self/mountinfo') as file_handle:
+        for line in file_handle:
+            fields = line.split()
+            separator = fields.index('-')
+            fstype, options = fields[separator + 1], fields[separator + 3]
+            if fstype == 'cgroup' and 'pids' in options.split(','):
+                mounts['pids'] = fields[4]
+            elif fstype == 'cgroup2':
+                mounts.setdefault('', fields[4])
+    with open('/proc/self/cgroup') as file_handle:
+        for line in file_handle:
+            _, controllers, path = line.rstrip('\n').split(':', 2)
+            if 'pids' in controllers.split(',') and 'pids' in mounts:
+                yield os.path.join(mounts['pids'], path.lstrip('/'))
+            elif not controllers and '' in mounts:
+                yield os.path.join(mounts[''], path.lstrip('/'))
+
+
+def _pids_cgroup_parent():
+    """Return the cgroup directory in which this process can create cgroups
+    with a pids.max limit, or an empty string if there is none. The answer
+    is found once per process."""
+    global _cgroup_parent
+    with _cgroup_lock:
+        if _cgroup_parent is None:
+            _cgroup_parent = ''
+            try:
+                directories = list(_cgroup_directories())
+            except (OSError, ValueError):
+                directories = []
+            for directory in directories:
+                probe = os.path.join(directory, f'ms-sandbox-{os.getpid()}-probe')
+                try:
+                    os.mkdir(probe)
+                except OSError:
+                    continue
+                try:
+                    usable = os.path.exists(os.path.join(probe, 'pids.max')) and os.access(
+                        os.path.join(probe, 'cgroup.procs'), os.W_OK
+                    )
+                finally:
+                    os.rmdir(probe)
+                if usable:
+                    _cgroup_parent = directory
+                    break
+        return _cgroup_parent
+
+
+def _make_pids_cgroup(processes):
+    """Return a new cgroup which allows processes processes, or None if one
+    cannot be made."""
+    parent = _pids_cgroup_parent()
+    if not parent:
+        return None
+    cgroup = os.path.join(parent, f'ms-sandbox-{os.getpid()}-{next(_cgroup_numbers)}')
+    try:
+        os.mkdir(cgroup)
+    except OSError:
+        return None
+    try:
+        with open(os.path.join(cgroup, 'pids.max'), 'w') as file_handle:
+            file_handle.write(str(processes))
+    except OSError:
+        os.rmdir(cgroup)
+        return None
+    return cgroup
+
+
+def _remove_cgroup(cgroup):
+    """Kill every process left in cgroup, including any which started a
+    session of their own, and remove it."""
+    for _ in range(100):
+        try:
+            with open(os.path.join(cgroup, 'cgroup.procs')) as file_handle:
+                pids = [int(pid) for pid in file_handle.read().split()]
+        except OSError:
+            return
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        try:
+            os.rmdir(cgroup)
+            return
+        except OSError:
+            # The processes are still exiting.
+            time.sleep(0.01)
+
+
+@contextlib.contextmanager
+def sandbox(limits=None):
+    """Yield the arguments to put before a command so that it runs with
+    limits. The process limit is enforced by a pids cgroup made for the
+    command, which is removed, and anything left in it killed, when the
+    block ends. Where no cgroup can be made the limit falls back to
+    RLIMIT_NPROC, but only if the environment variable
+    MS_SANDBOX_DEDICATED_USER is 1 to say the grader's user runs nothing
+    else; otherwise the process limit is not applied."""
+    global _warned_no_process_limit
+    if limits is None:
+        limits = default_limits()
+    cgroup = None
+    prefix = []
+    if limits.processes:
+        cgroup = _make_pids_cgroup(limits.processes)
+        if cgroup:
+            # The shell moves itself into the cgroup before it execs.
+            prefix = [
+                '/bin/sh', '-c', 'echo $$ > "$0" && exec "$@"',
+                os.path.join(cgroup, 'cgroup.procs'),
+            ]
+            limits = limits._replace(processes=None)
+        elif os.environ.get('MS_SANDBOX_DEDICATED_USER') != '1':
+            limits = limits._replace(processes=None)
+            if not _warned_no_process_limit:
+                _warned_no_process_limit = True
+                setup_logger().warning(
+                    'No pids cgroup is available; the number of processes is not limited.'
+                )
+    try:
+        yield prefix + sandbox_prefix(limits)
+    finally:
+        if cgroup:
+            _remove_cgroup(cgroup)
+
+
+def _command_list(cmd, shell):
+    """Return cmd as a list of arguments, as subprocess.Popen would run it.
+    A string is run by /bin/sh when shell is True."""
+    if shell:
+        return ['/bin/sh', '-c', cmd]
+    if isinstance(cmd, str):
+        return [cmd]
+    return list(cmd)
+
+
+def kill_process_group(pgid):
+    """Kill every process in the process group pgid."""
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+_peak_lock = threading.Lock()
+_peak_rss = 0
+
+
+def peak_memory():
+    """Return the largest max_rss, in kilobytes, of the sandboxed commands
+    run since the last call to reset_peak_memory()."""
+    return _peak_rss
+
+
+def reset_peak_memory():
+    """Forget the peak memory of the commands run so far."""
+    global _peak_rss
+    with _peak_lock:
+        _peak_rss = 0
+
+
+def children_cpu_time():
+    """Return the CPU seconds used by all the child processes this process
+    has waited for, including pexpect's."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _communicate(proc, input, deadline):
+    """Write input to proc's stdin and read its stdout and stderr until the
+    pipes close or the monotonic clock reaches deadline. Returns the bytes
+    read from each pipe by name and True if every pipe closed. The pipes
+    are closed on return either way."""
+    output = {}
+    pending = input.encode() if input else b''
+    offset = 0
+    with selectors.DefaultSelector() as selector:
+        if proc.stdin:
+            if pending:
+                selector.register(proc.stdin, selectors.EVENT_WRITE)
+            else:
+                proc.stdin.close()
+        for name, pipe in (('stdout', proc.stdout), ('stderr', proc.stderr)):
+            if pipe:
+                output[name] = []
+                selector.register(pipe, selectors.EVENT_READ, name)
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, _ in selector.select(remaining):
+                if key.fileobj is proc.stdin:
+                    try:
+                        # A writable pipe takes PIPE_BUF bytes without blocking.
+                        offset += os.write(key.fd, pending[offset:offset + select.PIPE_BUF])
+                    except BrokenPipeError:
+                        offset = len(pending)
+                    data = offset < len(pending)
+                else:
+                    data = os.read(key.fd, 65536)
+                    if data:
+                        output[key.data].append(data)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+        closed = not selector.get_map()
+        # A process which left the group may still hold the pipes open.
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+    return ({name: b''.join(chunks) for name, chunks in output.items()}, closed)
+
+
+def run_sandboxed(cmd, cwd=None, timeout=15, limits=None, shell=False, input=None, env=None, capture_output=True):
+    """Run cmd with limits, in its own process group, and return a
+    SandboxResult with its text output. If cmd runs longer than timeout
+    seconds its process group is killed and timed_out is True. Processes
+    left behind in the group when cmd exits are killed too, and if any
+    process still holds the output open when timeout runs out, for
+    instance one which started a session of its own, the output is cut
+    short and timed_out is True. When capture_output is False the output
+    is discarded."""
+    with sandbox(limits) as prefix:
+        return _run_sandboxed(
+            prefix + _command_list(cmd, shell), cwd, timeout, input, env, capture_output
+        )
+
+
+def _run_sandboxed(argv, cwd, timeout, input, env, capture_output):
+    global _peak_rss
+    start = time.perf_counter()
+    deadline = time.monotonic() + timeout
+    output_pipe = subprocess.PIPE if capture_output else subprocess.DEVNULL
+    proc = subprocess.Popen(
+        argv,
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=output_pipe,
+        stderr=output_pipe,
+        start_new_session=True,
+    )
+    waited = {}
+
+    def wait():
+        # wait4 reaps the command and returns the resources it and the
+        # children it waited for used.
+        waited['status'] = os.wait4(proc.pid, 0)
+        # Kill what the command left behind so the pipes close.
+        kill_process_group(proc.pid)
+
+    waiter = threading.Thread(target=wait, daemon=True)
+    waiter.start()
+    output, closed = _communicate(proc, input, deadline)
+    waiter.join(max(0, deadline - time.monotonic()))
+    timed_out = not closed or waiter.is_alive()
+    if waiter.is_alive():
+        kill_process_group(proc.pid)
+        waiter.join()
+    _, wait_status, usage = waited['status']
+    # Popen must not try to reap the command again.
+    proc.returncode = os.waitstatus_to_exitcode(wait_status)
+    with _peak_lock:
+        _peak_rss = max(_peak_rss, usage.ru_maxrss)
+    return SandboxResult(
+        returncode=proc.returncode,
+        stdout=output.get('stdout', b'').decode('utf-8', 'replace'),
+        stderr=output.get('stderr', b'').decode('utf-8', 'replace'),
+        timed_out=timed_out,
+        wall=time.perf_counter() - start,
+        cpu=usage.ru_utime + usage.ru_stime,
+        max_rss=usage.ru_maxrss,
+    )
@@ -0,0 +1,99 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Private scratch directories for build and test jobs. A job works on a
+    copy of the part's directory so jobs never share a working directory,
+    and the files the job creates, changes or removes are mirrored back to
+    the part's directory when it finishes. Set the environment variable
+    MS_SCRATCH_DIR to choose where scratch directories are made or
+    MS_SCRATCH_SHM to 1 to make them on the /dev/shm tmpfs. Set MS_SCRATCH
+    to 0 to work in the part's directory itself. """
+
+import contextlib
+import os
+import os.path
+import shutil
+import tempfile
+
+shm_directory = '/dev/shm'
+
+
+def scratch_root():
+    """Return the directory to make scratch directories in, or None for the
+    system's temporary directory."""
+    root = os.environ.get('MS_SCRATCH_DIR')
+    if not root and os.environ.get('MS_SCRATCH_SHM') == '1':
+        if os.path.isdir(shm_directory) and os.access(shm_directory, os.W_OK):
+            root = shm_directory
+    return root
+
+
+def _snapshot(directory):
+    """Map each file below directory to its size and modification time."""
+    files = {}
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            stat = os.lstat(path)
+            files[os.path.relpath(path, directory)] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def _copy_back(scratch, directory, before):
+    """Mirror the changes made in scratch since the snapshot before to
+    directory."""
+    after = _snapshot(scratch)
+    for name, state in after.items():
+        if before.get(name) != state:
+            destination = os.path.join(directory, name)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            if os.path.lexists(destination):
+                os.unlink(destination)
+            shutil.copy2(os.path.join(scratch, name), destination, follow_symlinks=False)
+    for name in before.keys() - after.keys():
+        try:
+            os.unlink(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+@contextlib.contextmanager
+def scratch_directory(directory):
+    """Copy directory into a new scratch directory and yield the copy's
+    path. If the block finishes without an exception, the changes made in
+    the copy are mirrored back to directory. The copy is then removed."""
+    if os.environ.get('MS_SCRATCH') == '0':
+        yield directory
+        return
+    with tempfile.TemporaryDirectory(prefix='job-', dir=scratch_root()) as scratch:
+        work = os.path.join(scratch, os.path.basename(os.path.abspath(directory)))
+        # copy2 keeps modification times so make sees which objects are
+        # up to date.
+        shutil.copytree(
+            directory, work, symlinks=True, ignore=shutil.ignore_patterns('.git')
+        )
+        before = _snapshot(work)
+        yield work
+        _copy_back(work, directory, before)
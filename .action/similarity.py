@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Find near-identical submissions across a class. Each source file's
+    comment-stripped tokens are winnowed into k-gram fingerprints which
+    are summarized by a MinHash signature. Signatures are kept in a
+    locality-sensitive hashing (LSH) index so only files which share a
+    band of their signature are compared, and the index can be grown as
+    repositories are graded. """
+
+import argparse
+import collections
+import hashlib
+import os
+import os.path
+import pickle
+import random
+import sys
+import tempfile
+from ccsrcutilities import cpp_tokens, glob_all_src_files, remove_cpp_comments
+from logger import setup_logger
+from resultcache import file_digest
+
+_mersenne_prime = (1 << 61) - 1
+
+
+def _hash(text):
+    return int.from_bytes(
+        hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big'
+    )
+
+
+def winnow(text, k=5, window=4):
+    """Return the set of winnowed fingerprints of the C++ source text. The
+    hashes of every k consecutive tokens are computed and the smallest
+    hash in each window of hashes is kept."""
+    tokens = [
+        token
+        for kind, token in cpp_tokens(text)
+        if kind not in ('space', 'newline', 'splice')
+    ]
+    hashes = [
+        _hash('\0'.join(tokens[index:index + k]))
+        for index in range(max(len(tokens) - k + 1, 0))
+    ]
+    if not hashes:
+        return set()
+    window = min(window, len(hashes))
+    fingerprints = set()
+    for index in range(len(hashes) - window + 1):
+        fingerprints.add(min(hashes[index:index + window]))
+    return fingerprints
+
+
+class SimilarityIndex:
+    """A MinHash LSH index of source files. Files are added under a group,
+    such as part-1/find_palindrome.cc, and a name, such as the repository,
+    and only files in the same group are compared. Fingerprints which
+    appear in the starter code are ignored; every file is signed again
+    when the starter code changes."""
+
+    def __init__(self, num_perm=64, bands=16, seed=1):
+        if num_perm % bands:
+            raise ValueError('num_perm must be a multiple of bands')
+        self.num_perm = num_perm
+        self.bands = bands
+        generator = random.Random(seed)
+        self._permutations = [
+            (generator.randrange(1, _mersenne_prime), generator.randrange(_mersenne_prime))
+            for _ in range(num_perm)
+        ]
+        self._starter = frozenset()
+        # (group, name) -> (file digest, fingerprints, signature)
+        self._entries = {}
+        # (group, band, band values) -> set of names
+        self._buckets = collections.defaultdict(set)
+
+    def signature(self, fingerprints):
+        """Return the MinHash signature of a set of fingerprints."""
+        fingerprints = fingerprints - self._starter
+        if not fingerprints:
+            return None
+        return tuple(
+            min((a * fp + b) % _mersenne_prime for fp in fingerprints)
+            for a, b in self._permutations
+        )
+
+    def _bands(self, signature):
+        rows = self.num_perm // self.bands
+        for band in range(self.bands):
+            yield band, signature[band * rows:(band + 1) * rows]
+
+    def __setstate__(self, state):
+        # Indexes saved before fingerprints were kept cannot be signed
+        # again; their files are added anew when their repositories are.
+        self.__dict__.update(state)
+        self._starter = frozenset(self._starter)
+        for key, entry in list(self._entries.items()):
+            if len(entry) == 2:
+                self._entries[key] = (entry[0], None, entry[1])
+
+    def set_starter(self, files):
+        """Ignore the fingerprints of the starter code files, replacing any
+        starter code given before. If that changes the ignored fingerprints,
+        the files already in the index are signed again."""
+        starter = set()
+        for file in files:
+            text = remove_cpp_comments(file)
+            if text is not None:
+                starter.update(winnow(text))
+        if starter == self._starter:
+            return
+        self._starter = frozenset(starter)
+        entries = self._entries
+        self._entries = {}
+        self._buckets.clear()
+        for (group, name), (digest, fingerprints, _) in entries.items():
+            if fingerprints is not None:
+                self._insert(group, name, digest, fingerprints)
+
+    def _insert(self, group, name, digest, fingerprints):
+        signature = self.signature(fingerprints)
+        self._entries[(group, name)] = (digest, fingerprints, signature)
+        if signature:
+            for band, values in self._bands(signature):
+                self._buckets[(group, band, values)].add(name)
+
+    def add(self, group, name, file):
+        """Add or replace the file for name in group. A file which has not
+        changed since it was last added is skipped."""
+        digest = file_digest(file)
+        previous = self._entries.get((group, name))
+        if previous and previous[0] == digest and previous[1] is not None:
+            return
+        self.remove(group, name)
+        text = remove_cpp_comments(file)
+        fingerprints = frozenset(winnow(text)) if text is not None else frozenset()
+        self._insert(group, name, digest, fingerprints)
+
+    def remove(self, group, name):
+        """Remove name's file from group if present."""
+        previous = self._entries.pop((group, name), None)
+        if previous and previous[2]:
+            for band, values in self._bands(previous[2]):
+                bucket = self._buckets.get((group, band, values))
+                if bucket:
+                    bucket.discard(name)
+                    if not bucket:
+                        del self._buckets[(group, band, values)]
+
+    def add_repo(self, repo, parts=None):
+        """Add the C++ source files in each part of repo, or in the whole
+        repository if parts is not given. The repository's directory name
+        is the name of its files."""
+        name = os.path.basename(os.path.abspath(repo))
+        for part in parts or ['.']:
+            for file in glob_all_src_files(os.path.join(repo, part)):
+                group = os.path.normpath(os.path.relpath(file, repo))
+                self.add(group, name, file)
+
+    def score(self, group, first, second):
+        """Return the estimated Jaccard similarity of two files."""
+        first = self._entries[(group, first)][2]
+        second = self._entries[(group, second)][2]
+        if not first or not second:
+            return 0.0
+        return sum(a == b for a, b in zip(first, second)) / self.num_perm
+
+    def candidate_pairs(self, threshold=0.5):
+        """Return (score, group, name, name) tuples, highest score first, for
+        files which share at least one band and whose estimated similarity is
+        at least threshold."""
+        pairs = set()
+        for (group, _, _), names in self._buckets.items():
+            if len(names) > 1:
+                names = sorted(names)
+                for index, first in enumerate(names):
+                    for second in names[index + 1:]:
+                        pairs.add((group, first, second))
+        candidates = []
+        for group, first, second in pairs:
+            score = self.score(group, first, second)
+            if score >= threshold:
+                candidates.append((score, group, first, second))
+        candidates.sort(key=lambda candidate: (-candidate[0],) + candidate[1:])
+        return candidates
+
+    def save(self, path):
+        """Write the index to path atomically."""
+        out_dir = os.path.dirname(os.path.abspath(path))
+        handle, tmp_path = tempfile.mkstemp(dir=out_dir)
+        with os.fdopen(handle, 'wb') as file_handle:
+            pickle.dump(self, file_handle)
+        os.replace(tmp_path, path)
+
+
+def load_similarity_index(path):
+    """Return the index saved at path or a new, empty index if there is no
+    such file."""
+    try:
+        with open(path, 'rb') as file_handle:
+            return pickle.load(file_handle)
+    except FileNotFoundError:
+        return SimilarityIndex()
+
+
+def main():
+    """Main function; add repositories to a similarity index and print the
+    candidate pairs."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('repos', nargs='*', help='student repositories to add')
+    parser.add_argument(
+        '-i', '--index', default='similarity.pickle',
+        help='similarity index to update (default: similarity.pickle)',
+    )
+    parser.add_argument(
+        '-s', '--starter', action='append', default=[],
+        help='starter code directory whose code is ignored; may be repeated',
+    )
+    parser.add_argument(
+        '-t', '--threshold', type=float, default=0.5,
+        help='minimum estimated similarity to report (default: 0.5)',
+    )
+    args = parser.parse_args()
+    logger = setup_logger()
+    index = load_similarity_index(args.index)
+    if args.starter:
+        index.set_starter(
+            file for starter in args.starter for file in glob_all_src_files(starter)
+        )
+    for repo in args.repos:
+        if not os.path.isdir(repo):
+            logger.error('No such directory %s.', repo)
+            sys.exit(1)
+        index.add_repo(repo)
+    index.save(args.index)
+    for score, group, first, second in index.candidate_pairs(args.threshold):
+        print(f'{score:.2f} {group} {first} {second}')
+
+
+if __name__ == '__main__':
+    main()
@@ -32,304 +32,89 @@
 # ex.
 # .action/solution_check_p1.py  part-1 asgt
 
-import difflib
-import logging
-import io
 import os
 import os.path
 import sys
-import pexpect
-from assessment import csv_solution_check_make, make
-from logger import setup_logger
-
-
-def run_p1(binary):
-    """Run part-1"""
-    logger = setup_logger()
-    status = []
-    error_values = (
-        ['Empty', 'Please provide a path to a file'], # 0 arguments, too few
-        ['foobar', 'Could not open the file foobar'], # non-existant file
+from assessment import csv_solution_check_make
+from profiling import count_lines, profile_scaling
+from testspec import TestCase, run_test_table
+
+
+def _usage_error_cases(missing_file):
+    """Test cases for the usage errors every part's program must report."""
+    return [
+        # 0 arguments, too few
+        TestCase(stdout=['Please provide a path to a file'], exit_zero=False),
+        TestCase(
+            args=[missing_file],
+            stdout=[f'Could not open the file {missing_file}'],
+            exit_zero=False,
+        ),
+    ]
+
+
+p1_tests = _usage_error_cases('foobar') + [
+    TestCase(args=[words_file], stdout=[palindromes], inputs=[words_file])
+    for words_file, palindromes in (
+        ['words_1.txt', 'tibbit kook'],
+        ['words_2.txt', 'stots ululu susus siris'],
+        ['words_3.txt', 'kinnikinnik mallam semes peeweep abba keek'],
+        ['words_4.txt', "goog mallam acca rever hagigah anana arara tirrit"],
     )
-    values = (
-                ['words_1.txt', 'tibbit kook'],
-                ['words_2.txt', 'stots ululu susus siris'],
-                ['words_3.txt', 'kinnikinnik mallam semes peeweep abba keek'],
-                ['words_4.txt', "goog mallam acca rever hagigah anana arara tirrit"],
-            )
-    for index, val in enumerate(error_values):
-        test_number = index + 1
-        logger.info('Test %d - %s', test_number, val)
-        rv = _run_p1_error(binary, val)
-        if not rv:
-            logger.error("Did not receive expected response for test %d.", test_number)
-        status.append(rv)
-
-    for index, val in enumerate(values):
-        test_number = len(error_values) + index + 1
-        logger.info('Test %d - %s', test_number, val)
-        rv = _run_p1(binary, val)
-        if not rv:
-            logger.error("Did not receive expected response for test %d.", test_number)
-        status.append(rv)
-    return status
-
-def _run_p1_error(binary, values):
-    logger = setup_logger()
-    status = False
-    if values[0] == "Empty":
-        proc = pexpect.spawn(binary, timeout=1)
-    else:
-        proc = pexpect.spawn(binary, timeout=1, args=[values[0]])
-    # proc.logfile = sys.stdout.buffer
-    values = list(map(str, values))
+]
+
+p2_tests = _usage_error_cases('/foobar') + [
+    TestCase(
+        args=[out_file],
+        stdout=[
+            "Type your message out and when you're done press return or enter",
+            f"Your secret message was saved into {out_file}",
+        ],
+        stdin=[message],
+        expected_file=(out_file, message),
+    )
+    for out_file, message in (
+        ['out_1.txt', 'Practical politics consists in ignoring facts.'],
+        ['out_2.txt', 'Every silver lining has a cloud around it.'],
+        ['out_3.txt', "You're reasoning is excellent -- it's"],
+        ['out_4.txt', "All of the true things I am about to tell you are shameless lies."],
+    )
+]
 
-    with io.BytesIO() as log_stream:
-        proc.logfile = log_stream
-        try:
-            regex = values[1].replace(' ', '\\s+')
-            proc.expect(
-                fr'(?i).*{regex}.*'
-            )
-        except (pexpect.exceptions.TIMEOUT, pexpect.exceptions.EOF) as exception:
-            expected_output = values[1].replace(' ', '\n')
-            logger.error(f'Expected: "{expected_output}"')
-            logger.error('Could not find expected output.')
-            logger.error('Your output: "%s"', log_stream.getvalue().decode('utf-8'))
-            logger.debug("%s", str(exception))
-            logger.debug(str(proc))
-            return status
+p3_tests = _usage_error_cases('/foobar') + [
+    TestCase(
+        args=['Makefile'],
+        expected_output_file='Makefile',
+        inputs=['Makefile'],
+        timeout=20,
+    ),
+]
 
-        proc.expect(pexpect.EOF)
-        proc.close()
-        if proc.exitstatus == 0:
-            logger.error("Expected: non-zero exit code.")
-            logger.error(f'Exit code was {proc.exitstatus}.')
-            logger.error("Program returned zero, but non-zero is required")
-            logger.error('Your output: "%s"', log_stream.getvalue().decode('utf-8'))
-            return status
-    status = True
-    return status    
 
-def _run_p1(binary, values):
-    """The actual test with the expected input and output"""
-    logger = setup_logger()
-    status = False
-    proc = pexpect.spawn(binary, timeout=1, args=[values[0]])
-    # proc.logfile = sys.stdout.buffer
-    values = list(map(str, values))
+def run_p1(binary):
+    """Run part-1"""
+    return run_test_table(binary, p1_tests)
 
-    with io.BytesIO() as log_stream:
-        proc.logfile = log_stream
-        try:
-            regex = values[1].replace(' ', '\\s+')
-            proc.expect(
-                fr'(?i)\s*{regex}\s*'
-            )
-        except (pexpect.exceptions.TIMEOUT, pexpect.exceptions.EOF) as exception:
-            expected_output = values[1].replace(' ', '\n')
-            logger.error(f'Expected: "{expected_output}"')
-            logger.error('Could not find expected output.')
-            logger.error('Your output: "%s"', log_stream.getvalue().decode('utf-8'))
-            logger.debug("%s", str(exception))
-            logger.debug(str(proc))
-            return status
 
-        proc.expect(pexpect.EOF)
-        proc.close()
-        if proc.exitstatus != 0:
-            logger.error("Expected: zero exit code.")
-            logger.error(f'Exit code was {proc.exitstatus}.')
-            logger.error("Program returned non-zero, but zero is required")
-            logger.error('Your output: "%s"', log_stream.getvalue().decode('utf-8'))
-            return status
-    status = True
-    return status
+def profile_p1(binary):
+    """Profile part-1 on the words files, which grow from 15 to 65,535
+    lines."""
+    directory = os.path.dirname(binary)
+    corpus = [
+        (count_lines(os.path.join(directory, words_file)), [words_file])
+        for words_file in ('words_1.txt', 'words_2.txt', 'words_3.txt', 'words_4.txt')
+    ]
+    return profile_scaling(binary, corpus)
 
 
 def run_p2(binary):
     """Run part-2"""
-    logger = setup_logger()
-    status = []
-    error_values = (
-        ['Empty', 'Please provide a path to a file'], # 0 arguments, too few
-        ['/foobar', 'Could not open the file /foobar'], # Non-writable file
-    )
-    values = (
-                ['out_1.txt', 'Practical politics consists in ignoring facts.'],
-                ['out_2.txt', 'Every silver lining has a cloud around it.'],
-                ['out_3.txt', "You're reasoning is excellent -- it's"],
-                ['out_4.txt', "All of the true things I am about to tell you are shameless lies."],
-            )
-    for index, val in enumerate(error_values):
-        test_number = index + 1
-        logger.info('Test %d - %s', test_number, val)
-        rv = _run_p1_error(binary, val)
-        if not rv:
-            logger.error("Did not receive expected response for test %d.", test_number)
-        status.append(rv)
-
-    for index, val in enumerate(values):
-        test_number = len(error_values) + index + 1
-        logger.info('Test %d - %s', test_number, val)
-        rv = _run_p2(binary, val)
-        if not rv:
-            logger.error("Did not receive expected response for test %d.", test_number)
-        status.append(rv)
-    return status
-
-
-def _run_p2(binary, values):
-    logger = setup_logger()
-    status = False
-    proc = pexpect.spawn(binary, timeout=1, args=[values[0]])
-    # proc.logfile = sys.stdout.buffer
-    values = list(map(str, values))
-
-    with io.BytesIO() as log_stream:
-        proc.logfile = log_stream
-        expected_output = "Type your message out and when you're done press return or enter"
-        try:
-            regex = expected_output.replace(' ', '\\s+')
-            proc.expect(
-                fr'(?i).*{regex}.*'
-            )
-        except (pexpect.exceptions.TIMEOUT, pexpect.exceptions.EOF) as exception:
-            logger.error(f'Expected: "{expected_output}"')
-            logger.error('Could not find expected output.')
-            logger.error('Your output: "%s"', log_stream.getvalue().decode('utf-8'))
-            logger.debug("%s", str(exception))
-            logger.debug(str(proc))
-            return status
-
-        proc.sendline(values[1])
-        
-        expected_output = f"Your secret message was saved into {values[0]}"
-        try:
-            regex = expected_output.replace(' ', '\\s+')
-            proc.expect(
-                fr'(?i).*{regex}.*'
-            )
-        except (pexpect.exceptions.TIMEOUT, pexpect.exceptions.EOF) as exception:
-            logger.error(f'Expected: "{expected_output}"')
-            logger.error('Could not find expected output.')
-            logger.error('Your output: "%s"', log_stream.getvalue().decode('utf-8'))
-            logger.debug("%s", str(exception))
-            logger.debug(str(proc))
-            return status
-        
-
-        proc.expect(pexpect.EOF)
-        proc.close()
-        if proc.exitstatus != 0:
-            logger.error("Expected: zero exit code.")
-            logger.error(f'Exit code was {proc.exitstatus}.')
-            logger.error("Program returned non-zero, but zero is required")
-            logger.error('Your output: "%s"', log_stream.getvalue().decode('utf-8'))
-            return status
-    with open(values[0]) as fh:
-        file_contents = fh.read()
-    diff = difflib.context_diff(
-        values[1].split(),
-        file_contents.split(),
-        'Given Input',
-        f"File {values[0]} Contents",
-        n=3,
-    )
-    diff = list(diff)
-    if diff:
-        logger.error("Expected: contents of the file to match the input given.")
-        logger.error(f"File contents: {file_contents}")
-        logger.error(f'Expected: {values[1]}')
-        logger.error('\n'.join(diff))
-        return status
-        
-    status = True
-    return status
+    return run_test_table(binary, p2_tests)
 
 
 def run_p3(binary):
     """Run part-3"""
-    logger = setup_logger()
-    status = []
-    error_values = (
-        ['Empty', 'Please provide a path to a file'], # 0 arguments, too few
-        ['/foobar', 'Could not open the file /foobar'], # Non-readable file
-    )
-    values = (
-                ['Makefile', ],
-            )
-    for index, val in enumerate(error_values):
-        test_number = index + 1
-        logger.info('Test %d - %s', test_number, val)
-        rv = _run_p1_error(binary, val)
-        if not rv:
-            logger.error("Did not receive expected response for test %d.", test_number)
-        status.append(rv)
-
-    for index, val in enumerate(values):
-        test_number = len(error_values) + index + 1
-        logger.info('This may take a while: Test %d - %s', test_number, val)
-        rv = _run_p3(binary, val)
-        if not rv:
-            logger.error("Did not receive expected response for test %d.", test_number)
-        status.append(rv)
-    return status
-
-
-def _run_p3(binary, values):
-    """The actual test with the expected input and output"""
-    logger = setup_logger()
-    status = True
-    proc = pexpect.spawn(binary, timeout=20, args=[values[0]])
-    # proc.logfile = sys.stdout.buffer
-    values = list(map(str, values))
-
-    with io.BytesIO() as log_stream:
-        proc.logfile = log_stream
-        try:
-            proc.expect(
-                fr'(?i).*'
-            )
-        except (pexpect.exceptions.TIMEOUT, pexpect.exceptions.EOF) as exception:
-            # logger.error(f'Expected: "{expected_output}"')
-            logger.error('Could not find expected output.')
-            logger.error('Your output: "%s"', log_stream.getvalue().decode('utf-8'))
-            logger.debug("%s", str(exception))
-            logger.debug(str(proc))
-            status = False
-            return status       
-
-        proc.expect(pexpect.EOF)
-        
-        actual_output = log_stream.getvalue().decode('utf-8').splitlines()
-        try:
-            with open('Makefile') as fh:
-                expected_output = fh.read().splitlines()
-            diff = difflib.context_diff(
-                actual_output,
-                expected_output,
-                'Actual Output',
-                'Expected Output',
-                n=3,
-            )
-            diff = list(diff)
-            if len(diff) != 0:
-                logger.error('❌ Did not find expected output in actual output.')
-                logger.info('\n'.join(diff))
-                status = False
-        except FileNotFoundError as exception:
-            logger.error('❌ Could not open "Makefile" for reading. Skipping verification.')
-        
-        proc.close()
-        
-        if proc.exitstatus != 0:
-            logger.error("Expected: zero exit code.")
-            logger.error(f'Exit code was {proc.exitstatus}.')
-            logger.error("Program returned non-zero, but zero is required")
-            logger.error('Your output: "%s"', log_stream.getvalue().decode('utf-8'))
-            status = False
-    return status
+    return run_test_table(binary, p3_tests)
 
 
 tidy_opts = (
@@ -364,34 +149,28 @@ tidy_opts = (
     '{key: readability-identifier-naming.IgnoreMainLikeFunctions, value: 1}]}"'
 )
 
+# The test suite to run for each part of the lab.
+part_runs = {
+    'part-1': run_p1,
+    'part-2': run_p2,
+    'part-3': run_p3,
+}
+
+part_profiles = {
+    'part-1': profile_p1,
+}
+
 if __name__ == '__main__':
     cwd = os.getcwd()
     repo_name = os.path.basename(os.path.dirname(cwd))
 
-    if sys.argv[1] == 'part-1':
-        csv_solution_check_make(
-            csv_key=repo_name,
-            target_directory=sys.argv[2],
-            program_name=sys.argv[3],
-            run=run_p1,
-            # do_lint_check=False,
-            tidy_options=tidy_opts,
-        )
-    elif sys.argv[1] == 'part-2':
-        csv_solution_check_make(
-            csv_key=repo_name,
-            target_directory=sys.argv[2],
-            program_name=sys.argv[3],
-            run=run_p2,
-            # do_lint_check=False,
-            tidy_options=tidy_opts,
-        )
-    elif sys.argv[1] == 'part-3':
+    if sys.argv[1] in part_runs:
         csv_solution_check_make(
             csv_key=repo_name,
             target_directory=sys.argv[2],
             program_name=sys.argv[3],
-            run=run_p3,
+            run=part_runs[sys.argv[1]],
+            profile=part_profiles.get(sys.argv[1]),
             # do_lint_check=False,
             tidy_options=tidy_opts,
         )
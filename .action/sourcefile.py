@@ -0,0 +1,127 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" A source file from a student's submission. The file is read, hashed
+    and parsed at most once no matter how many checks look at it. """
+
+import hashlib
+import re
+import threading
+from parse_header import dict_header
+
+header_keys = ['name', 'class', 'email', 'github', 'asgt', 'partners', 'comment']
+
+main_regex = re.compile(
+    r'int\s*main\s*\(int\s*argc,\s*(const)?\s*char\s*(const)?\s*\*\s*argv\[\]\)'
+)
+
+
+class SourceFile:
+    """A source file whose contents, content hash, parsed header and main
+    function are computed lazily and cached. A SourceFile may be passed
+    anywhere a path is expected since it implements os.PathLike."""
+
+    __slots__ = ('path', '_data', '_contents', '_digest', '_header', '_has_main')
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+        self._contents = None
+        self._digest = None
+        self._header = None
+        self._has_main = None
+
+    def __fspath__(self):
+        return self.path
+
+    def __str__(self):
+        return self.path
+
+    def __repr__(self):
+        return 'SourceFile({!r})'.format(self.path)
+
+    @property
+    def data(self):
+        """The raw bytes of the file."""
+        if self._data is None:
+            with open(self.path, 'rb') as file_handle:
+                self._data = file_handle.read()
+        return self._data
+
+    @property
+    def contents(self):
+        """The contents of the file as a string."""
+        if self._contents is None:
+            self._contents = self.data.decode('utf-8', 'replace')
+        return self._contents
+
+    @property
+    def digest(self):
+        """The SHA-256 hex digest of the file's contents."""
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.data).hexdigest()
+        return self._digest
+
+    @property
+    def header(self):
+        """The file's header as parsed by dict_header; empty if the
+        header is malformed."""
+        if self._header is None:
+            self._header = dict_header(self.contents, silent=True)
+        return self._header
+
+    @property
+    def missing_header_keys(self):
+        """The header fields missing from the file's header."""
+        return [key for key in header_keys if key not in self.header]
+
+    @property
+    def has_main(self):
+        """True if the file defines a C++ main function."""
+        if self._has_main is None:
+            self._has_main = main_regex.search(self.contents) is not None
+        return self._has_main
+
+
+_source_files = {}
+_source_files_lock = threading.Lock()
+
+
+def source_file(file):
+    """Return the shared SourceFile for the path file. A SourceFile is
+    returned unchanged."""
+    if isinstance(file, SourceFile):
+        return file
+    with _source_files_lock:
+        if file not in _source_files:
+            _source_files[file] = SourceFile(file)
+        return _source_files[file]
+
+
+def forget_source_files():
+    """Drop the shared SourceFiles so the next grading run rereads the
+    files from disk."""
+    with _source_files_lock:
+        _source_files.clear()
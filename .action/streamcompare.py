@@ -0,0 +1,139 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Compare a program's output with the expected output as it is
+    produced. The comparison stops at the first line which differs, or
+    as soon as an unfinished line can no longer match, and only a small
+    window of recent lines is kept for the error report, so memory use
+    does not grow with the amount of output. """
+
+import codecs
+import collections
+
+
+class StreamComparator:
+    """Match a stream of bytes line by line against expected_lines. Call
+    feed() with each chunk of output and finish() once the stream ends.
+    Lines are split the same way str.splitlines() splits them, so '\\r\\n'
+    from a pseudo-terminal matches '\\n' in the expected file."""
+
+    __slots__ = ('expected', 'line_number', 'partial', 'window', 'diverged', 'actual_line')
+
+    def __init__(self, expected_lines, window=5):
+        self.expected = expected_lines
+        self.line_number = 0
+        self.partial = bytearray()
+        self.window = collections.deque(maxlen=window)
+        self.diverged = False
+        self.actual_line = None
+
+    def _match_line(self, line):
+        if self.line_number >= len(self.expected) or line != self.expected[self.line_number]:
+            self.diverged = True
+            self.actual_line = line
+            return False
+        self.window.append(line)
+        self.line_number += 1
+        return True
+
+    def _match_segment(self, segment):
+        text = segment.decode('utf-8', 'replace')
+        for line in text.splitlines() if text else ['']:
+            if not self._match_line(line):
+                return False
+        return True
+
+    def _partial_fits(self):
+        """Return True if the unterminated last line can still become the
+        expected output. An incomplete character at the end is left out."""
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        lines = decoder.decode(bytes(self.partial)).splitlines()
+        for offset, line in enumerate(lines):
+            index = self.line_number + offset
+            if index >= len(self.expected):
+                return False
+            if offset == len(lines) - 1:
+                return self.expected[index].startswith(line)
+            if line != self.expected[index]:
+                return False
+        return True
+
+    def feed(self, data):
+        """Compare the next chunk of output. Returns False as soon as the
+        output has diverged from the expected lines, including as soon as
+        an unterminated line is longer than the expected line."""
+        if self.diverged:
+            return False
+        last_newline = data.rfind(b'\n')
+        if last_newline >= 0:
+            self.partial += data[:last_newline]
+            segments = self.partial.split(b'\n')
+            self.partial = bytearray(data[last_newline + 1:])
+            for segment in segments:
+                if not self._match_segment(bytes(segment)):
+                    return False
+        else:
+            self.partial += data
+        if self.partial and not self._partial_fits():
+            self.diverged = True
+            decoder = codecs.getincrementaldecoder('utf-8')('replace')
+            self.actual_line = decoder.decode(bytes(self.partial))
+            return False
+        return True
+
+    def finish(self):
+        """Compare the unterminated last line, if any, and check that no
+        expected lines are missing. Returns True if the output matched."""
+        if self.diverged:
+            return False
+        if self.partial and not self._match_segment(bytes(self.partial)):
+            return False
+        self.partial = bytearray()
+        if self.line_number < len(self.expected):
+            self.diverged = True
+            return False
+        return True
+
+    def report(self):
+        """Describe where the output diverged as a list of lines showing
+        the last matching lines, the actual line and the expected line."""
+        lines = [f'Output differs at line {self.line_number + 1}.']
+        lines.extend('  ' + line for line in self.window)
+        if self.actual_line is None:
+            lines.append('- (end of output)')
+        else:
+            lines.append('- ' + self.actual_line)
+        if self.line_number < len(self.expected):
+            lines.append('+ ' + self.expected[self.line_number])
+        else:
+            lines.append('+ (end of expected output)')
+        return lines
+
+    def excerpt(self):
+        """The most recent output, for error messages."""
+        lines = list(self.window)
+        if self.actual_line is not None:
+            lines.append(self.actual_line)
+        return '\n'.join(lines)
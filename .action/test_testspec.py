@@ -0,0 +1,101 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Tests for memoizing test case outcomes across builds. """
+
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+import assessment
+import testspec
+from scratch import scratch_directory
+from testspec import TestCase, run_test_table
+
+_makefile = """TARGET = hello
+CXXFILES = hello.cc
+CXXFLAGS += -g -O2
+
+$(TARGET): $(CXXFILES:.cc=.o)
+\t$(CXX) $(CXXFLAGS) -o $@ $^
+
+all: $(TARGET)
+
+spotless:
+\trm -f $(TARGET) $(CXXFILES:.cc=.o)
+"""
+
+_source = """// Author: {author}
+#include <iostream>
+int main() {{ std::cout << "hello" << std::endl; return 0; }}
+"""
+
+
+@unittest.skipUnless(shutil.which('make') and shutil.which('g++'), 'needs make and g++')
+class MemoizedOutcomeTest(unittest.TestCase):
+    """A rebuild in a new scratch directory reuses the recorded outcomes."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.part = os.path.join(self.directory, 'part-1')
+        os.mkdir(self.part)
+        with open(os.path.join(self.part, 'Makefile'), 'w') as file_handle:
+            file_handle.write(_makefile)
+        environment = {
+            'MS_GRADER_CACHE_DIR': os.path.join(self.directory, 'cache'),
+            'MS_SCRATCH_DIR': self.directory,
+            'CXX': 'g++',
+        }
+        patcher = unittest.mock.patch.dict(os.environ, environment)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _build_and_run(self, author):
+        with open(os.path.join(self.part, 'hello.cc'), 'w') as file_handle:
+            file_handle.write(_source.format(author=author))
+        table = [TestCase(stdout=['hello'])]
+        # Build from source every time rather than restoring the binary.
+        no_artifacts = unittest.mock.patch.object(
+            assessment, 'result_cache',
+            lambda name: None if name == 'artifacts' else testspec.result_cache(name),
+        )
+        with no_artifacts, scratch_directory(self.part) as build_directory:
+            self.assertTrue(assessment.make_build(build_directory))
+            return run_test_table(os.path.join(build_directory, 'hello'), table)
+
+    def test_rebuild_after_comment_edit_hits_memo(self):
+        with unittest.mock.patch.object(
+            testspec, 'run_test_case', wraps=testspec.run_test_case
+        ) as run_test_case:
+            self.assertEqual(self._build_and_run('Tuffy'), [True])
+            self.assertEqual(self._build_and_run('Tuffy Titan'), [True])
+        self.assertEqual(run_test_case.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
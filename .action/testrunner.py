@@ -0,0 +1,80 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Run a part's test cases concurrently. Each case runs in a thread
+    driven by an asyncio event loop and gets its own scratch working
+    directory, so cases which read or write files relative to the
+    working directory do not interfere with each other. """
+
+import asyncio
+import os
+import os.path
+import tempfile
+from logger import setup_logger
+from scratch import scratch_root
+
+# The number of test cases run at once unless MS_TEST_WORKERS says otherwise.
+DEFAULT_TEST_WORKERS = 4
+
+
+def _run_in_scratch(binary, case, inputs):
+    """Run one case in a fresh scratch directory holding links to the
+    input files."""
+    run_case, values = case
+    source_dir = os.path.dirname(binary)
+    with tempfile.TemporaryDirectory(prefix='testcase-', dir=scratch_root()) as cwd:
+        for name in inputs:
+            source = os.path.join(source_dir, name)
+            if os.path.exists(source):
+                os.symlink(source, os.path.join(cwd, name))
+        return run_case(binary, values, cwd)
+
+
+async def _run_cases(binary, cases, inputs, max_concurrency):
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_one(case):
+        async with semaphore:
+            return await asyncio.to_thread(_run_in_scratch, binary, case, inputs)
+
+    return await asyncio.gather(*(run_one(case) for case in cases))
+
+
+def run_cases(binary, cases, inputs=(), max_concurrency=None):
+    """Run the test cases for binary concurrently and return a list of
+    their results in the order given. Each case is a (function, values)
+    pair; the function is called as function(binary, values, cwd) where
+    cwd is the case's scratch directory. The files named in inputs are
+    linked into every scratch directory from the binary's directory. The
+    number of cases running at once defaults to the environment variable
+    MS_TEST_WORKERS or DEFAULT_TEST_WORKERS. Keep it small; the cases have
+    short timeouts which an overloaded machine makes correct programs
+    miss."""
+    logger = setup_logger()
+    binary = os.path.abspath(binary)
+    if not max_concurrency:
+        max_concurrency = int(os.environ.get('MS_TEST_WORKERS', DEFAULT_TEST_WORKERS))
+    logger.debug('Running %d test cases, %d at a time', len(cases), max_concurrency)
+    return list(asyncio.run(_run_cases(binary, cases, inputs, max(1, max_concurrency))))
@@ -0,0 +1,335 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Declarative test cases for student programs and a single executor
+    which runs them with pexpect. A part's tests are a table of TestCase
+    objects; the expected output patterns are compiled once when the
+    table is built. """
+
+import collections
+import contextvars
+import difflib
+import io
+import logging
+import os.path
+import re
+import time
+import pexpect
+from logger import setup_logger
+from resultcache import cache_key, file_digest, result_cache
+from sandbox import kill_process_group, sandbox
+from streamcompare import StreamComparator
+from timing import span
+from testrunner import run_cases
+
+
+def expected_pattern(text):
+    """Compile text into a case insensitive bytes pattern which matches the
+    words of text separated by any amount of whitespace."""
+    words = [re.escape(word.encode('utf-8')) for word in text.split()]
+    return re.compile(b'(?i)' + rb'\s+'.join(words))
+
+
+class TestCase:
+    """One run of a student's program. The program is started with args.
+    Each string in stdout must appear in the program's output in order;
+    after the n-th string is seen, the n-th line of stdin is sent. The
+    exit status must be zero when exit_zero is True and non-zero
+    otherwise. If expected_file is a (filename, text) pair, the words of
+    the file the program wrote must match the words of text. If
+    expected_output_file names a file, the program's remaining output must
+    match its contents line for line; the comparison is streamed and stops
+    at the first difference. The files named in inputs are made
+    available in the program's working directory."""
+
+    __slots__ = (
+        'args', 'stdout', 'patterns', 'stdin', 'exit_zero', 'expected_file',
+        'expected_output_file', 'inputs', 'timeout',
+    )
+
+    def __init__(self, args=(), stdout=(), stdin=(), exit_zero=True,
+                 expected_file=None, expected_output_file=None, inputs=(),
+                 timeout=1):
+        self.args = tuple(args)
+        self.stdout = tuple(stdout)
+        self.patterns = tuple(expected_pattern(text) for text in self.stdout)
+        self.stdin = tuple(stdin)
+        self.exit_zero = exit_zero
+        self.expected_file = expected_file
+        self.expected_output_file = expected_output_file
+        self.inputs = tuple(inputs)
+        self.timeout = timeout
+
+    def __str__(self):
+        # Include the expected output so a failing case shows what was
+        # wanted.
+        return str(list(self.args or ['Empty']) + list(self.stdin) + list(self.stdout))
+
+    def spec(self):
+        """Return a tuple of everything which defines the case."""
+        return (
+            self.args, self.stdout, self.stdin, self.exit_zero,
+            self.expected_file, self.expected_output_file, self.inputs,
+            self.timeout,
+        )
+
+
+CaseOutcome = collections.namedtuple('CaseOutcome', ['passed', 'exit_status', 'log'])
+
+
+def _log_output(logger, log_stream):
+    logger.error('Your output: "%s"', log_stream.getvalue().decode('utf-8', 'replace'))
+
+
+def _stream_compare(proc, expected_lines, timeout):
+    """Read proc's output until EOF, comparing it line by line with
+    expected_lines. Returns the comparator and True if the program
+    finished within timeout seconds. Reading stops at the first line that
+    differs."""
+    comparator = StreamComparator(expected_lines)
+    deadline = time.monotonic() + timeout
+    if proc.buffer:
+        comparator.feed(proc.buffer)
+        proc.buffer = b''
+    while not comparator.diverged:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return comparator, False
+        try:
+            data = proc.read_nonblocking(4096, timeout=remaining)
+        except pexpect.exceptions.EOF:
+            comparator.finish()
+            break
+        except pexpect.exceptions.TIMEOUT:
+            return comparator, False
+        comparator.feed(data)
+    return comparator, True
+
+
+def _log_exit_status(logger, case, proc):
+    if case.exit_zero:
+        logger.error("Expected: zero exit code.")
+        logger.error(f'Exit code was {proc.exitstatus}.')
+        logger.error("Program returned non-zero, but zero is required")
+    else:
+        logger.error("Expected: non-zero exit code.")
+        logger.error(f'Exit code was {proc.exitstatus}.')
+        logger.error("Program returned zero, but non-zero is required")
+
+
+def _kill(proc):
+    """Kill the program and anything it started."""
+    kill_process_group(proc.pid)
+    proc.close(force=True)
+
+
+class _CaseLogHandler(logging.Handler):
+    """Keep the messages logged while a test case runs in the list held by
+    _case_log in the case's thread."""
+
+    def emit(self, record):
+        messages = _case_log.get()
+        if messages is not None:
+            messages.append((record.levelno, record.getMessage()))
+
+
+_case_log = contextvars.ContextVar('case_log', default=None)
+
+# Cases run concurrently, so their messages are held back and written
+# with the case's header by run_test_table.
+_case_logger = logging.getLogger('testspec.case')
+_case_logger.setLevel(logging.INFO)
+_case_logger.propagate = False
+_case_logger.addHandler(_CaseLogHandler())
+
+
+def run_test_case(binary, case, cwd=None):
+    """Run binary as described by case with cwd as the working directory.
+    Returns a CaseOutcome recording whether the program behaved as
+    expected, its exit status, which is None if it had to be killed, and
+    the messages logged about the run."""
+    messages = []
+    token = _case_log.set(messages)
+    try:
+        with span('test case', category='test', case=case):
+            # pexpect starts the program in a new session, so its process
+            # group can be killed with it. The limits are applied by a
+            # command which then execs the program.
+            with sandbox() as prefix:
+                command = prefix + [binary] + list(case.args)
+                proc = pexpect.spawn(
+                    command[0],
+                    timeout=case.timeout,
+                    args=command[1:],
+                    cwd=cwd,
+                )
+                passed = _run_test_case(proc, case, cwd)
+    finally:
+        _case_log.reset(token)
+    return CaseOutcome(passed, proc.exitstatus, messages)
+
+
+def _run_test_case(proc, case, cwd):
+    logger = _case_logger
+    with io.BytesIO() as log_stream:
+        proc.logfile = log_stream
+        for index, (expected_output, pattern) in enumerate(zip(case.stdout, case.patterns)):
+            try:
+                proc.expect(pattern)
+            except (pexpect.exceptions.TIMEOUT, pexpect.exceptions.EOF) as exception:
+                logger.error(f'Expected: "{expected_output}"')
+                logger.error('Could not find expected output.')
+                _log_output(logger, log_stream)
+                logger.debug("%s", str(exception))
+                logger.debug(str(proc))
+                _kill(proc)
+                return False
+            if index < len(case.stdin):
+                proc.sendline(case.stdin[index])
+
+        if case.expected_output_file:
+            try:
+                with open(os.path.join(cwd or '.', case.expected_output_file)) as fh:
+                    expected_output = fh.read().splitlines()
+            except FileNotFoundError as exception:
+                logger.error(
+                    '❌ Could not open "%s" for reading. Skipping verification.',
+                    case.expected_output_file,
+                )
+                expected_output = None
+        if case.expected_output_file and expected_output is not None:
+            # Compare the rest of the output as it arrives instead of
+            # keeping all of it.
+            proc.logfile = None
+            comparator, finished = _stream_compare(proc, expected_output, case.timeout)
+            if comparator.diverged:
+                logger.error('❌ Did not find expected output in actual output.')
+                logger.info('\n'.join(comparator.report()))
+                _kill(proc)
+                return False
+            if not finished:
+                logger.error('Expected: the program to exit.')
+                logger.error('The program did not finish in %d seconds.', case.timeout)
+                logger.error('Your output: "%s"', comparator.excerpt())
+                _kill(proc)
+                return False
+            proc.close()
+            if case.exit_zero != (proc.exitstatus == 0):
+                _log_exit_status(logger, case, proc)
+                logger.error('Your output: "%s"', comparator.excerpt())
+                return False
+        else:
+            try:
+                proc.expect(pexpect.EOF)
+            except pexpect.exceptions.TIMEOUT as exception:
+                logger.error('Expected: the program to exit.')
+                logger.error('The program did not finish in %d seconds.', case.timeout)
+                _log_output(logger, log_stream)
+                _kill(proc)
+                return False
+            proc.close()
+            if case.exit_zero != (proc.exitstatus == 0):
+                _log_exit_status(logger, case, proc)
+                _log_output(logger, log_stream)
+                return False
+
+    if case.expected_file:
+        filename, expected_text = case.expected_file
+        try:
+            with open(os.path.join(cwd or '.', filename)) as fh:
+                file_contents = fh.read()
+        except FileNotFoundError as exception:
+            logger.error(f'Expected: the file {filename} to be written.')
+            return False
+        diff = list(difflib.context_diff(
+            expected_text.split(),
+            file_contents.split(),
+            'Given Input',
+            f"File {filename} Contents",
+            n=3,
+        ))
+        if diff:
+            logger.error("Expected: contents of the file to match the input given.")
+            logger.error(f"File contents: {file_contents}")
+            logger.error(f'Expected: {expected_text}')
+            logger.error('\n'.join(diff))
+            return False
+    return True
+
+
+def _test_cache_key(binary_digest, case, input_dir):
+    """Return the cache key for running case on a binary: the binary's
+    digest, the case's definition and the digests of its input files."""
+    inputs = []
+    for name in case.inputs:
+        try:
+            inputs.append((name, file_digest(os.path.join(input_dir, name))))
+        except FileNotFoundError:
+            inputs.append((name, None))
+    return cache_key('test-outcome', binary_digest, repr(case.spec()), *inputs)
+
+
+def _run_memoized(binary, values, cwd):
+    """Run a test case, reusing the recorded outcome, messages included, of
+    an earlier run of the same case on a byte-identical binary with the
+    same inputs. Runs in which the program had to be killed, such as
+    timeouts, are not recorded."""
+    case, cache, key = values
+    if key:
+        recorded = cache.get_json(key)
+        if recorded is not None:
+            return CaseOutcome(recorded['passed'], recorded['exit_status'], recorded['log'])
+    outcome = run_test_case(binary, case, cwd)
+    if key and outcome.exit_status is not None:
+        cache.put_json(key, outcome._asdict())
+    return outcome
+
+
+def run_test_table(binary, table):
+    """Run every TestCase in table against binary and return a list with
+    True for each case that passed. Outcomes are memoized in the 'tests'
+    result cache. The cases run concurrently; once they finish, each
+    case's header, messages and verdict are logged together in order."""
+    logger = setup_logger()
+    inputs = sorted({name for case in table for name in case.inputs})
+    cache = result_cache('tests')
+    binary_digest = file_digest(binary) if cache and os.path.exists(binary) else None
+    cases = []
+    for case in table:
+        key = None
+        if binary_digest:
+            key = _test_cache_key(binary_digest, case, os.path.dirname(binary))
+        cases.append((_run_memoized, (case, cache, key)))
+    outcomes = run_cases(binary, cases, inputs=inputs)
+    for test_number, (case, outcome) in enumerate(zip(table, outcomes), start=1):
+        if case.timeout > 5:
+            logger.info('This may take a while: Test %d - %s', test_number, case)
+        else:
+            logger.info('Test %d - %s', test_number, case)
+        for level, message in outcome.log:
+            logger.log(level, '%s', message)
+        if not outcome.passed:
+            logger.error("Did not receive expected response for test %d.", test_number)
+    return [outcome.passed for outcome in outcomes]
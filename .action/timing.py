@@ -0,0 +1,143 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Lightweight timing of the grading pipeline's stages. Timing is off
+    unless the environment variable MS_TIMING is 1 or MS_TRACE names a
+    file; when off, span() returns a shared do-nothing context manager.
+    When MS_TRACE is set, every span is written to that file as a Chrome
+    trace event (open it with chrome://tracing or Perfetto). A '%p' in
+    the file name is replaced with the process ID; worker processes add
+    their process ID even without one, so each writes its own trace. """
+
+import atexit
+import collections
+import json
+import os
+import threading
+import time
+
+trace_path = os.environ.get('MS_TRACE')
+enabled = bool(trace_path) or os.environ.get('MS_TIMING') == '1'
+
+_events = []
+_stage_durations = collections.defaultdict(float)
+_lock = threading.Lock()
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'category', 'args', 'start', 'wall_start')
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.start
+        with _lock:
+            if self.category == 'stage':
+                _stage_durations[self.name] += duration
+            if trace_path:
+                _events.append({
+                    'name': self.name,
+                    'cat': self.category,
+                    'ph': 'X',
+                    'ts': int(self.wall_start * 1e6),
+                    'dur': int(duration * 1e6),
+                    'pid': os.getpid(),
+                    'tid': threading.get_ident(),
+                    'args': self.args,
+                })
+        return False
+
+
+def span(name, category='stage', **args):
+    """Return a context manager which times the enclosed block. Spans in the
+    'stage' category are also summed per name for stage_durations(). Any
+    keyword arguments are recorded with the trace event."""
+    if not enabled:
+        return _null_span
+    return _Span(name, category, {key: str(value) for key, value in args.items()})
+
+
+def stage_durations():
+    """Return the total seconds spent in each stage since the last call to
+    reset_stage_durations(). Empty when timing is off."""
+    with _lock:
+        return dict(_stage_durations)
+
+
+def reset_stage_durations():
+    """Start timing a new grading run."""
+    with _lock:
+        _stage_durations.clear()
+
+
+def write_trace(path=None):
+    """Write the recorded spans to path, or the MS_TRACE file, in the
+    Chrome trace event format."""
+    path = (path or trace_path).replace('%p', str(os.getpid()))
+    with _lock:
+        events = list(_events)
+    with open(path, 'w') as file_handle:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file_handle)
+
+
+def worker_trace_path():
+    """Return the trace file for a worker process: the MS_TRACE file with
+    '%p' replaced by the process ID or, if it has no '%p', with the process
+    ID added before its extension, so workers do not overwrite each other's
+    traces."""
+    if '%p' in trace_path:
+        return trace_path.replace('%p', str(os.getpid()))
+    root, extension = os.path.splitext(trace_path)
+    return f'{root}.{os.getpid()}{extension}'
+
+
+def _write_trace_at_exit():
+    if _events:
+        write_trace()
+
+
+if trace_path:
+    atexit.register(_write_trace_at_exit)